@@ -65,8 +65,8 @@ import sys
 from pathlib import Path
 import pandas as pd
 #módulos internos
-from vazoes_txt import VazoesTxt
-from modelo_camila import ModeloCamila
+from vazoes_txt import CenariosVazoes, VazoesTxt
+from modelo_camila import ModeloMultiPosto
 #Verificação do arquivo
 
 folderpath = Path(__file__).parent
@@ -141,22 +141,25 @@ modelos_preenchido = []
 #e preenche com a previsão extendida, retornando 20 arquivos
 
 for idx, objeto_vazoes in enumerate(lista_vazoes):
-    for posto in lista_postos:
-        model = ModeloCamila(coluna=posto, posicao=1)
-        model.fit(lista_vazoes[idx].df_period)
-        modelos.append(model)
-        #Parametrização do modelo
-        #Predição para um novo período
-        novo_trecho = model.predict()
-
-        # Junção do período do arquivo com o período previsto
-        vazoes_new = vazoes.add_novo_periodo(novo_trecho)
-        modelos_preenchido.append(vazoes_new)
-        # Junção do período do arquivo com o período previsto
-        vazoes_new = vazoes.add_novo_periodo(novo_trecho)
-        # Salva novo arquivo de vazões no formato txt
-        
-        vazoes_new.salvar_txt(arquivo_new)
+    #Correlações, ranking e teste da amplitude calculados uma única vez para
+    #todos os postos principais do arquivo
+    model = ModeloMultiPosto(lista_postos, posicao=1)
+    model.fit(objeto_vazoes.df_period, objeto_vazoes.indice_razao())
+    modelos.extend(model.modelos_.values())
+    #Predição para um novo período
+    previsoes = model.predict()
+    novos_trechos = [previsoes[posto] for posto in lista_postos]
+
+    # Junção do período do arquivo com o período previsto de cada posto.
+    # O histórico é compartilhado pelos cenários e formatado uma única vez
+    cenarios = CenariosVazoes.from_dfs(objeto_vazoes, novos_trechos)
+    modelos_preenchido.append(cenarios)
+
+    # Salva um novo arquivo de vazões no formato txt para cada posto
+    nome = Path(lista_caminhos[idx])
+    cenarios.salvar_todos([Path(arquivo_new) / f"{nome.stem}_{posto}{nome.suffix}"
+                           for posto in lista_postos],
+                          threads=len(lista_postos))
         
 #%%
 ano_das_correlacoes = []
@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 """Em desenvolvimento."""
 
-from modelos import calc_corr_last12
+from cache_correlacao import calc_corr_last12_cache
 import pandas as pd
 from typing import Optional
 import numpy as np
+from amplitude import APROVADO, IndiceRazao, TesteAmplitude, motivos_candidatos
+from modelos import RankingCorrelacao
+from perfil import medido
+from v import df_somente_leitura
+
+#Candidatos avaliados de uma só vez no teste da amplitude
+CANDIDATOS_POR_BLOCO = 5
 
 class ModeloCamila:
     """
@@ -27,6 +34,14 @@ class ModeloCamila:
         Correlação para as outras colunas na <posicao>
     mes_final_periodo_ : str
         'Ano-mes' do perído com a <posicao> melhor correlação para <coluna>
+    aprovados_ : DataFrame
+        Resultado do teste da amplitude (candidato x posto) para todos os
+        postos dos candidatos avaliados. True para os que passaram.
+    num_falhas_ : Series
+        Quantidade de postos que falharam no teste em cada candidato.
+    motivos_ : ndarray
+        Resultado do teste (ver `telemetria.MOTIVOS`) de cada candidato
+        percorrido, da posição 1 do ranking até o escolhido.
     """
 
     # pylint: disable=too-many-instance-attributes
@@ -34,7 +49,8 @@ class ModeloCamila:
     def __init__(self,
                  coluna: int,
                  posicao: int = 1,
-                 ignore_step_corr: bool = True):
+                 ignore_step_corr: bool = True,
+                 postos_amplitude: Optional[list] = None):
         """
         Criação do modelo.
 
@@ -45,11 +61,15 @@ class ModeloCamila:
         posicao : int, optional
             Posição na ordenação de maiores correlações.
             O default é a usar a primeira posição (1).
+        postos_amplitude : list, optional
+            Postos que devem passar no teste da amplitude, por exemplo os de
+            um subsistema. O default é apenas a <coluna>.
 
         """
         self.coluna = coluna
         self.posicao = posicao
         self.ignore_step_corr = ignore_step_corr
+        self.postos_amplitude = postos_amplitude
 
         # Atributos que serão definidos apenas ao realizar o fit
         self.df_base = None
@@ -58,9 +78,17 @@ class ModeloCamila:
         self.correlacao_ = None
         self.correlacao_outros_ = None
         self.mes_final_periodo_ = None
+        self.aprovados_ = None
+        self.num_falhas_ = None
+        self.motivos_ = None
+        self._ranking = None
 
 
-    def fit(self, df_base: pd.DataFrame) -> 'ModeloCamila':
+    @medido('fit')
+    def fit(self,
+            df_base: pd.DataFrame,
+            indice_razao: Optional[IndiceRazao] = None,
+            ) -> 'ModeloCamila':
         """
         Cálculo das correlações e verificação do Teste de Amplitude.
 
@@ -72,98 +100,112 @@ class ModeloCamila:
         ----------
         df_base : DataFrame
             Dados históricos para cálculo das correlações.
+        indice_razao : IndiceRazao, optional
+            Limites do teste da amplitude já calculados para df_base
+            (`VazoesTxt.indice_razao`). Se não informado, são calculados.
             
         Return
         ----------
             O próprio objeto: self.
 
         """
-        self.df_base = df_base.copy()
+        df_base = df_somente_leitura(df_base)
         #Realiza o cálculo da correlação
-        self.df_correlacao = calc_corr_last12(df_base)
-        #Ranking das correlações
-        top_corr = self.df_correlacao[self.coluna].sort_values(ascending=False)
-        
-        
-        #Condições para o realizae o teste da amplitude
-        #Substituir as posição no ranking
-        #posicao_atual = self.posicao
-        
-        #ERROR
-        #ESTÁ INDO ATÉ A DÉCIMA POSIÇÃO
-        for posicao_atual in range(1, 11):
-            
-            # Dados que serão usados para previsão
-            self._period_ = top_corr.index[posicao_atual]
-            
-            
-            #Para selecionar o primeiro mês da previsão extendida
-            mes_escolhido_ini = self._period_ + 1        
-            #série com os dados do primeiro mês da previsão extendida
-            series_proximo_mes = self.df_base.loc[mes_escolhido_ini]
-            #Renomeando index
-            series_proximo_mes.name = self.df_base.index[-1] + 1
-            
-            #Acrescentando o primeiro mês da previsão extendida nos dados originais
-            df_base_modif = pd.concat([self.df_base, series_proximo_mes.to_frame().T])
-            
-            
-            #Cálculo da razão
-            #Dividindo a vazão dos meses pelo seu mês posterior
-            df_razao = df_base_modif.shift(1) / df_base_modif
-            #substitui os valores NaN e infinito por zero
-            df_razao.replace([np.inf, np.nan], 0, inplace=True)
-            #Identifica o mês para aplicar o teste da amplitude e retorna para todos os anos
-            #O mês selecionado é o que inicia a previsão
-            df_razao = df_razao[df_razao.index.month == mes_escolhido_ini.month]
-            #Razão da vazao da previsaõ da Refinitiv pelo primeiro mês da vazão extendida
-            df_razao_previsao = df_razao.iloc[-1, :]
-            #Valor máximo do histórico, excluindo a previsão da Refinitiv
-            df_razao_maximo = df_razao.iloc[:-1, :].max()
-            #Valor da razão mínima do histórico
-            df_razao_minima = df_razao.iloc[:-1, :].min()
-        
-            
-            #Variáveis que guardam quais foram as usinas que não passaram no teste
-            teste_amplitude_max = df_razao_previsao[df_razao_previsao >= df_razao_maximo]
-            teste_amplitude_min = df_razao_previsao[df_razao_previsao <= df_razao_minima]
-            
-            #Verifica se a usina de referência consta nas variáveis das usinas que falharam
-            teste_da_amplitude = (self.coluna in teste_amplitude_max.index.to_list() or
-                                  self.coluna in teste_amplitude_min.index.to_list())
-            
-            
-            #Se a usina falhar no teste, utiliza a próxima correlação até a décima posição no ranking
-            
-            # validação_amplitude = []
-            # if teste_da_amplitude is True:
-            #     validação_amplitude.append(posicao_atual)
-            
-            
-            # if self.ignore_step_corr == False and teste_da_amplitude == True:
-            #     continue
-            #     #self.ignore_step_corr = True
-            if teste_da_amplitude is False:
-                self.posicao = posicao_atual
+        df_correlacao = calc_corr_last12_cache(df_base)
+        #Ranking das correlações: apenas o primeiro bloco de candidatos é
+        #ordenado; o ranking é estendido se todo o bloco falhar
+        ranking = RankingCorrelacao(df_correlacao, [self.coluna], k=1 + CANDIDATOS_POR_BLOCO)
+
+        return self._ajustar(df_base,
+                             df_correlacao,
+                             ranking,
+                             TesteAmplitude(df_base, indice_razao))
+
+    def _ajustar(self,
+                 df_base: pd.DataFrame,
+                 df_correlacao: pd.DataFrame,
+                 ranking: RankingCorrelacao,
+                 teste: TesteAmplitude,
+                 ) -> 'ModeloCamila':
+        """
+        Escolha do período a partir das correlações e do teste já criados.
+
+        Os objetos recebidos podem ser compartilhados por vários modelos do
+        mesmo arquivo (ver `ModeloMultiPosto`).
+
+        """
+        self.df_base = df_base
+        self.df_correlacao = df_correlacao
+
+        #Teste da amplitude para os candidatos a partir da segunda posição do
+        #ranking (a primeira é o próprio período final) até a décima posição,
+        #em blocos: o ranking só é estendido se todo o bloco falhar.
+        #As razões do histórico e seus limites são calculados uma única vez,
+        #e o resultado de todos os postos vem da mesma comparação.
+        postos_amplitude = self.postos_amplitude or [self.coluna]
+        colunas = df_base.columns.get_indexer(postos_amplitude)
+        if (colunas < 0).any():
+            raise KeyError(f"Postos inexistentes: {np.asarray(postos_amplitude)[colunas < 0]}")
+
+        aprovado = None
+        blocos = list()
+        motivos = list()
+        for inicio in range(1, 11, CANDIDATOS_POR_BLOCO):
+            candidatos = ranking.periodos(self.coluna, inicio, min(inicio + CANDIDATOS_POR_BLOCO, 11))
+            blocos.append(teste.motivos(candidatos))
+
+            #Verifica se alguma das usinas de referência falhou
+            #Se falhar no teste, utiliza a próxima correlação até a décima posição no ranking
+            motivos.append(motivos_candidatos(blocos[-1].to_numpy(), colunas))
+            aprovados = np.flatnonzero(motivos[-1] == APROVADO)
+            if len(aprovados) > 0:
+                aprovado = inicio + int(aprovados[0])
+                #Os candidatos do bloco após o escolhido não são percorridos
+                motivos[-1] = motivos[-1][:aprovados[0] + 1]
                 break
-                
-                
-            
-                
-            
-            self.qualquer_coisa = top_corr.head(11).index
-        
-        
+
+        #Resultado do teste para todos os postos dos candidatos avaliados
+        self.aprovados_ = pd.concat(blocos) == APROVADO
+        self.num_falhas_ = (~self.aprovados_).sum(axis='columns')
+        self.motivos_ = np.concatenate(motivos)
+
+        if aprovado is not None:
+            self.posicao = aprovado
+            self._period_ = candidatos[aprovados[0]]
+        else:
+            #Nenhum candidato passou: fica o último período testado
+            self._period_ = candidatos[-1]
+
+        #Ranking guardado para qualquer_coisa, que só estende se for usado
+        self._ranking = ranking
+
         # Outras informações sobre o modelo 'treinado'
         # Usando sufixo _ semelhante ao scikit-learn
-        self.correlacao_ = top_corr.iloc[self.posicao]
-        self.correlacao_outros_ = self.df_correlacao.loc[top_corr.index[self.posicao]]
+        self.correlacao_ = ranking.correlacoes(self.coluna, self.posicao, self.posicao + 1)[0]
+        self.correlacao_outros_ = self.df_correlacao.iloc[
+            ranking.posicoes(self.coluna, self.posicao, self.posicao + 1)[0]]
         self.mes_final_periodo_ = self._period_.strftime('%Y-%m')
 
 
         return self
 
 
+    @property
+    def qualquer_coisa(self) -> pd.PeriodIndex:
+        """
+        Períodos das onze primeiras posições do ranking (a própria janela
+        final e as dez seguintes).
+
+        Como no fit original, existe apenas se o primeiro candidato falhou
+        no teste da amplitude. O ranking é estendido só quando o atributo
+        é usado.
+
+        """
+        if self._ranking is None or self.motivos_[0] == APROVADO:
+            raise AttributeError("'ModeloCamila' object has no attribute 'qualquer_coisa'")
+        return self._ranking.periodos(self.coluna, 0, 11)
+
+    @medido('predict')
     def predict(self,
                 num_meses: Optional[int] = None,
                 ) -> pd.DataFrame:
@@ -200,10 +242,132 @@ class ModeloCamila:
         # Dados do período escolhido
         df_escolhido = self.df_base.loc[mes_escolhido_ini:].iloc[:num_meses]
 
-        # Ajusta o index para o novo período
-        df_trecho_ajust = df_escolhido.copy()
-        df_trecho_ajust.index = pd.period_range(next_month,
-                                                periods=len(df_trecho_ajust),
-                                                freq='M')
+        # Ajusta o index para o novo período, sem copiar os dados
+        df_trecho_ajust = df_somente_leitura(df_escolhido,
+                                             pd.period_range(next_month,
+                                                             periods=len(df_escolhido),
+                                                             freq='M'))
 
         return df_trecho_ajust
+
+
+class ModeloMultiPosto:
+    """
+    Ajuste conjunto de vários postos de referência para um mesmo arquivo.
+
+    Equivale a um `ModeloCamila(coluna=posto)` por posto, mas as correlações,
+    o ranking, os limites do teste da amplitude e o teste dos candidatos são
+    calculados uma única vez e compartilhados por todos os postos.
+
+    Attributes
+    ----------
+    postos : list
+        Postos de referência, por exemplo os postos principais.
+    posicao : int
+        Posição inicial na ordem de maior correlação, como no ModeloCamila.
+    postos_amplitude : list or None
+        Postos que devem passar no teste da amplitude, como no ModeloCamila.
+    modelos_ : dict
+        Modelo ajustado de cada posto de referência.
+
+    """
+
+    def __init__(self,
+                 postos: list,
+                 posicao: int = 1,
+                 postos_amplitude: Optional[list] = None):
+        """
+        Criação do modelo.
+
+        Parameters
+        ----------
+        postos : list
+            Postos de referência.
+        posicao : int, optional
+            Posição na ordenação de maiores correlações.
+            O default é a usar a primeira posição (1).
+        postos_amplitude : list, optional
+            Postos que devem passar no teste da amplitude.
+            O default é apenas o posto de referência de cada modelo.
+
+        """
+        self.postos = list(postos)
+        self.posicao = posicao
+        self.postos_amplitude = postos_amplitude
+
+        # Atributos que serão definidos apenas ao realizar o fit
+        self.df_base = None
+        self.df_correlacao = None
+        self.modelos_ = dict()
+
+    @medido('fit_multiposto')
+    def fit(self,
+            df_base: pd.DataFrame,
+            indice_razao: Optional[IndiceRazao] = None,
+            ) -> 'ModeloMultiPosto':
+        """
+        Ajuste de todos os postos de referência.
+
+        Parameters
+        ----------
+        df_base : DataFrame
+            Dados históricos para cálculo das correlações.
+        indice_razao : IndiceRazao, optional
+            Limites do teste da amplitude já calculados para df_base.
+
+        Return
+        ----------
+            O próprio objeto: self.
+
+        """
+        #Uma única vista somente leitura compartilhada por todos os postos
+        self.df_base = df_somente_leitura(df_base)
+        self.df_correlacao = calc_corr_last12_cache(self.df_base)
+        ranking = RankingCorrelacao(self.df_correlacao, self.postos, k=1 + CANDIDATOS_POR_BLOCO)
+        teste = TesteAmplitude(self.df_base, indice_razao)
+
+        #Primeiro bloco de candidatos de todos os postos em uma única
+        #avaliação; os modelos reaproveitam os resultados
+        candidatos = ranking.periodos(self.postos[0], 1, 1 + CANDIDATOS_POR_BLOCO)
+        for posto in self.postos[1:]:
+            candidatos = candidatos.union(ranking.periodos(posto, 1, 1 + CANDIDATOS_POR_BLOCO))
+        teste.motivos(candidatos)
+
+        self.modelos_ = dict()
+        for posto in self.postos:
+            model = ModeloCamila(coluna=posto,
+                                 posicao=self.posicao,
+                                 postos_amplitude=self.postos_amplitude)
+            self.modelos_[posto] = model._ajustar(self.df_base, self.df_correlacao, ranking, teste)
+
+        return self
+
+    @property
+    def mes_final_periodo_(self) -> pd.Series:
+        """'Ano-mes' do período escolhido para cada posto de referência."""
+        return pd.Series({posto: model.mes_final_periodo_
+                          for posto, model in self.modelos_.items()},
+                         dtype=object)
+
+    def predict(self,
+                num_meses: Optional[int] = None,
+                ) -> dict:
+        """
+        Previsão para os próximos 'num_meses' de cada posto de referência.
+
+        Parameters
+        ----------
+        num_meses : int, optional
+            Número de meses a serem previstos.
+            Se não informado será feita a previsão até final do último ano informado.
+
+        Returns
+        -------
+        dict
+            Previsão (DataFrame) de cada posto de referência.
+
+        """
+        if not self.modelos_:
+            raise Exception("Realizar o fit do modelo antes")
+
+        return {posto: model.predict(num_meses) for posto, model in self.modelos_.items()}
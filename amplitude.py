@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""Teste da Amplitude vetorizado."""
+import copy
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from perfil import medido
+
+# Resultado do teste para cada posto de um candidato
+APROVADO = 0
+FALHA_MAXIMO = 1
+FALHA_MINIMO = 2
+
+
+def calc_razoes(valores: np.ndarray) -> np.ndarray:
+    """
+    Razão entre a vazão de cada mês e a do mês seguinte.
+
+    Equivale a `df.shift(1) / df` seguido de `replace([np.inf, np.nan], 0)`.
+
+    Parameters
+    ----------
+    valores : ndarray
+        Vazões (meses x postos).
+
+    Returns
+    -------
+    ndarray
+        Razões (meses x postos). A primeira linha é sempre 0.
+
+    """
+    razoes = np.zeros(valores.shape, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(valores[:-1], valores[1:], out=razoes[1:])
+    return _zerar_invalidos(razoes)
+
+
+def _zerar_invalidos(razoes: np.ndarray) -> np.ndarray:
+    """Substitui NaN e infinito (positivo) por zero, como no replace original."""
+    razoes[np.isnan(razoes) | (razoes == np.inf)] = 0
+    return razoes
+
+
+def motivos_candidatos(motivos: np.ndarray, colunas: np.ndarray) -> np.ndarray:
+    """
+    Resultado do teste de cada candidato para um conjunto de postos.
+
+    O candidato é aprovado apenas se todos os postos passarem. A falha pelo
+    máximo tem precedência sobre a falha pelo mínimo.
+
+    Parameters
+    ----------
+    motivos : ndarray
+        Resultado por posto (candidatos x postos), como em
+        `TesteAmplitude.motivos`.
+    colunas : ndarray
+        Posições dos postos que devem passar no teste.
+
+    Returns
+    -------
+    ndarray
+        APROVADO, FALHA_MAXIMO ou FALHA_MINIMO para cada candidato (int8).
+
+    """
+    motivos = motivos[:, colunas]
+    return np.where((motivos == FALHA_MAXIMO).any(axis=1), FALHA_MAXIMO,
+                    np.where((motivos == FALHA_MINIMO).any(axis=1), FALHA_MINIMO,
+                             APROVADO)).astype(np.int8)
+
+
+class IndiceRazao:
+    """
+    Razões mínima e máxima do histórico por mês do ano e posto.
+
+    Os limites do Teste da Amplitude não dependem do candidato: são
+    calculados uma única vez e atualizados ao acrescentar meses, sem
+    recalcular as razões de todo o histórico.
+
+    Attributes
+    ----------
+    minimo : ndarray
+        Razão mínima (12 x postos). Meses sem histórico ficam com NaN.
+    maximo : ndarray
+        Razão máxima (12 x postos). Meses sem histórico ficam com NaN.
+
+    """
+
+    def __init__(self, valores: np.ndarray, meses: np.ndarray):
+        """
+        Criação do índice a partir do histórico completo.
+
+        Parameters
+        ----------
+        valores : ndarray
+            Vazões (meses x postos).
+        meses : ndarray
+            Mês do ano (1 a 12) de cada linha de `valores`.
+
+        """
+        valores = np.asarray(valores, dtype=float)
+        meses = np.asarray(meses)
+        razoes = calc_razoes(valores)
+
+        self.minimo = np.full((12, valores.shape[1]), np.nan)
+        self.maximo = np.full((12, valores.shape[1]), np.nan)
+        for mes in range(1, 13):
+            razoes_mes = razoes[meses == mes]
+            if len(razoes_mes) > 0:
+                self.minimo[mes - 1] = razoes_mes.min(axis=0)
+                self.maximo[mes - 1] = razoes_mes.max(axis=0)
+
+        # Último mês do histórico, para a razão do próximo mês acrescentado
+        self._ultimo = valores[-1].copy()
+
+    @classmethod
+    def from_df_period(cls, df_period: pd.DataFrame) -> 'IndiceRazao':
+        """
+        Construtor a partir de um dataframe 'periodizado'.
+
+        Parameters
+        ----------
+        df_period : DataFrame
+            Dados históricos com PeriodIndex de frequência mensal.
+
+        """
+        return cls(df_period.to_numpy(dtype=float), df_period.index.month.to_numpy())
+
+    def copy(self) -> 'IndiceRazao':
+        """Cópia independente do índice."""
+        novo = copy.copy(self)
+        novo.minimo = self.minimo.copy()
+        novo.maximo = self.maximo.copy()
+        return novo
+
+    def adicionar(self, df_new_months: pd.DataFrame) -> 'IndiceRazao':
+        """
+        Acrescenta meses ao índice (no local).
+
+        Parameters
+        ----------
+        df_new_months : DataFrame
+            Novos meses, com o index já ajustado para continuar o histórico
+            e as colunas na mesma ordem do histórico.
+
+        Returns
+        -------
+        IndiceRazao
+            O próprio objeto: self.
+
+        """
+        novos = df_new_months.to_numpy(dtype=float)
+        if len(novos) == 0:
+            return self
+
+        anteriores = np.concatenate([self._ultimo[np.newaxis], novos[:-1]])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            razoes = _zerar_invalidos(anteriores / novos)
+
+        # fmin e fmax ignoram o NaN dos meses que ainda não tinham histórico
+        indices = df_new_months.index.month.to_numpy() - 1
+        np.fmin.at(self.minimo, indices, razoes)
+        np.fmax.at(self.maximo, indices, razoes)
+        self._ultimo = novos[-1].copy()
+
+        return self
+
+    def limites(self, mes: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Razões mínima e máxima de cada posto para o mês (1 a 12)."""
+        return self.minimo[mes - 1], self.maximo[mes - 1]
+
+
+class TesteAmplitude:
+    """
+    Teste da Amplitude para vários candidatos de uma só vez.
+
+    Os limites por mês vêm de um `IndiceRazao`, calculado apenas uma vez, e
+    cada candidato passa a custar uma única divisão por posto.
+
+    Attributes
+    ----------
+    df_base : DataFrame
+        Dados históricos (ano/mes x posto).
+
+    """
+
+    def __init__(self,
+                 df_base: pd.DataFrame,
+                 indice_razao: Optional[IndiceRazao] = None):
+        """
+        Criação do teste.
+
+        Parameters
+        ----------
+        df_base : DataFrame
+            Dados históricos com PeriodIndex de frequência mensal.
+        indice_razao : IndiceRazao, optional
+            Limites já calculados para o mesmo histórico (por exemplo, por
+            `VazoesTxt.indice_razao`). Se não informado, é calculado aqui.
+
+        """
+        self.df_base = df_base
+        # Apenas uma vista: os meses usados são convertidos em `avaliar`
+        self._valores = df_base.to_numpy()
+        if indice_razao is None:
+            indice_razao = IndiceRazao(self._valores, df_base.index.month.to_numpy())
+        self.indice_razao = indice_razao
+        # Resultado (postos) de cada candidato já avaliado em `motivos`
+        self._motivos: Dict[pd.Period, np.ndarray] = dict()
+
+    def limites(self, mes: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Razões mínima e máxima do histórico para o mês informado.
+
+        Parameters
+        ----------
+        mes : int
+            Mês (1 a 12) em que se inicia a previsão.
+
+        Returns
+        -------
+        tuple of ndarray
+            Razão mínima e razão máxima de cada posto.
+
+        """
+        return self.indice_razao.limites(mes)
+
+    @medido('teste_amplitude')
+    def avaliar(self, periodos) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Aplica o teste a todos os candidatos informados.
+
+        Para cada período candidato, o mês seguinte é acrescentado após o
+        último mês do histórico e sua razão é comparada com os limites do
+        histórico para o mesmo mês.
+
+        Parameters
+        ----------
+        periodos : PeriodIndex or list of Period
+            Períodos candidatos (final da janela de 12 meses escolhida).
+
+        Returns
+        -------
+        tuple of ndarray
+            Matrizes booleanas (candidatos x postos) indicando as usinas que
+            falharam no teste pelo máximo e pelo mínimo, respectivamente.
+
+        """
+        meses_ini = pd.PeriodIndex(periodos, freq='M') + 1
+        posicoes = self.df_base.index.get_indexer(meses_ini)
+        if (posicoes < 0).any():
+            raise KeyError(meses_ini[posicoes < 0][0])
+
+        # Razão da previsão pelo primeiro mês da vazão extendida
+        with np.errstate(divide='ignore', invalid='ignore'):
+            razao_previsao = (self._valores[-1].astype(float)
+                              / self._valores[posicoes].astype(float))
+        razao_previsao = _zerar_invalidos(razao_previsao)
+
+        indices = meses_ini.month.to_numpy() - 1
+        razao_minima = self.indice_razao.minimo[indices]
+        razao_maxima = self.indice_razao.maximo[indices]
+
+        return razao_previsao >= razao_maxima, razao_previsao <= razao_minima
+
+    def motivos(self, periodos) -> pd.DataFrame:
+        """
+        Resultado do teste, com o motivo da falha, para todos os postos.
+
+        Parameters
+        ----------
+        periodos : PeriodIndex or list of Period
+            Períodos candidatos (final da janela de 12 meses escolhida).
+
+        Returns
+        -------
+        DataFrame
+            APROVADO, FALHA_MAXIMO ou FALHA_MINIMO (candidato x posto, int8).
+            Se as duas falhas ocorrerem, vale a do máximo.
+
+        """
+        periodos = pd.PeriodIndex(periodos, freq='M')
+
+        # Apenas os candidatos ainda não avaliados passam pelo teste, de forma
+        # que vários modelos possam compartilhar o mesmo objeto
+        novos = periodos[~periodos.isin(list(self._motivos))].unique()
+        if len(novos) > 0:
+            falha_max, falha_min = self.avaliar(novos)
+            motivos = np.where(falha_max, FALHA_MAXIMO,
+                               np.where(falha_min, FALHA_MINIMO, APROVADO)).astype(np.int8)
+            self._motivos.update(zip(novos, motivos))
+
+        motivos = np.empty((len(periodos), len(self.df_base.columns)), dtype=np.int8)
+        for i, periodo in enumerate(periodos):
+            motivos[i] = self._motivos[periodo]
+
+        return pd.DataFrame(motivos,
+                            index=periodos,
+                            columns=self.df_base.columns)
+
+    def aprovados(self, periodos) -> pd.DataFrame:
+        """
+        Resultado do teste para todos os postos de cada candidato.
+
+        Parameters
+        ----------
+        periodos : PeriodIndex or list of Period
+            Períodos candidatos (final da janela de 12 meses escolhida).
+
+        Returns
+        -------
+        DataFrame
+            Booleanos (candidato x posto), True para os postos que passaram
+            no teste pelo máximo e pelo mínimo.
+
+        """
+        return self.motivos(periodos) == APROVADO
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks do fluxo leitura -> fit -> predict -> escrita.
+
+Os arquivos de vazões usados são sintéticos (ver `sintetico`), de forma que
+os benchmarks rodem em qualquer máquina.
+
+Uso (a partir da raiz do repositório, com pytest-benchmark instalado):
+    python -m pytest benchmarks --benchmark-only
+    python -m pytest benchmarks --benchmark-only --benchmark-group-by=group,param:num_postos
+    python -m pytest benchmarks --benchmark-autosave          # salva a execução
+    python -m pytest benchmarks --benchmark-compare           # compara com a última salva
+"""
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Fixtures compartilhadas: arquivos de vazões sintéticos de 10 a 999 postos."""
+import pytest
+
+from benchmarks.sintetico import POSTOS_PRINCIPAIS, gerar_arquivo
+import v
+
+# Quantidades de postos dos arquivos sintéticos. O campo do posto tem 3
+# caracteres, o que limita um arquivo a 999 postos
+NUM_POSTOS = [10, 100, 999]
+
+
+@pytest.fixture(scope='module', params=NUM_POSTOS, ids=lambda n: f"{n}_postos")
+def num_postos(request):
+    return request.param
+
+
+@pytest.fixture(scope='module')
+def arquivo(num_postos, tmp_path_factory):
+    """Arquivo vazoes.txt sintético, gerado uma vez por quantidade de postos."""
+    return gerar_arquivo(tmp_path_factory.mktemp('vazoes') / 'VAZOES.txt',
+                         num_postos=num_postos)
+
+
+@pytest.fixture(scope='module')
+def vazoes(arquivo):
+    """Vazões do arquivo sintético, compartilhadas pelo módulo (não alterar)."""
+    return v.VazoesTxt(arquivo)
+
+
+@pytest.fixture(scope='session')
+def posto():
+    """Posto de referência dos modelos."""
+    return POSTOS_PRINCIPAIS[0]
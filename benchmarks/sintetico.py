@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Gerador de arquivos vazoes.txt sintéticos."""
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+from v import VazoesTxt
+
+# Postos usados pelos modelos, sempre incluídos nos arquivos gerados
+POSTOS_PRINCIPAIS = [6, 74, 169, 275]
+
+# Maior vazão que cabe no campo de 6 caracteres do arquivo
+VAZAO_MAXIMA = 99999
+
+
+def gerar_df_arquivo(num_postos: int = 10,
+                     num_anos: int = 90,
+                     ano_inicial: int = 1931,
+                     meses_ultimo_ano: int = 4,
+                     sazonalidade: float = 0.6,
+                     persistencia: float = 0.7,
+                     ruido: float = 0.3,
+                     semente: int = 0,
+                     ) -> pd.DataFrame:
+    """
+    Dataframe no formato do arquivo de vazões com dados sintéticos.
+
+    Cada posto tem uma vazão média própria, um ciclo anual (cosseno com o
+    pico em um mês sorteado) e um ruído multiplicativo log-normal com
+    persistência de um mês para o outro (AR(1)). Os meses do último ano após
+    `meses_ultimo_ano` ficam zerados, como nos arquivos reais.
+
+    Parameters
+    ----------
+    num_postos : int, optional
+        Quantidade de postos (no máximo 999, pelo tamanho do campo). Os
+        postos principais são sempre incluídos. O default é 10.
+    num_anos : int, optional
+        Quantidade de anos. O default é 90.
+    ano_inicial : int, optional
+        Primeiro ano. O default é 1931.
+    meses_ultimo_ano : int, optional
+        Meses preenchidos no último ano. O default é 4.
+    sazonalidade : float, optional
+        Amplitude relativa do ciclo anual. O default é 0.6.
+    persistencia : float, optional
+        Coeficiente do AR(1) do ruído. O default é 0.7.
+    ruido : float, optional
+        Desvio padrão do ruído (log). O default é 0.3.
+    semente : int, optional
+        Semente do gerador aleatório. O default é 0.
+
+    Returns
+    -------
+    DataFrame
+        Dados (posto/ano x mes), como em `ler_arquivo_vazoes_txt`.
+
+    """
+    rng = np.random.default_rng(semente)
+
+    outros = np.setdiff1d(np.arange(1, 1000), POSTOS_PRINCIPAIS)
+    num_outros = max(num_postos - len(POSTOS_PRINCIPAIS), 0)
+    postos = np.sort(np.concatenate([POSTOS_PRINCIPAIS[:num_postos],
+                                     rng.choice(outros, num_outros, replace=False)]))
+
+    num_meses = num_anos * 12
+    media = rng.lognormal(np.log(1000), 1.0, len(postos))
+    pico = rng.integers(0, 12, len(postos))
+    meses = np.arange(num_meses) % 12
+    ciclo = 1 + sazonalidade * np.cos(2 * np.pi * (meses[:, np.newaxis] - pico) / 12)
+
+    choques = rng.normal(0, ruido, (num_meses, len(postos)))
+    log_ruido = np.empty_like(choques)
+    log_ruido[0] = choques[0]
+    for mes in range(1, num_meses):
+        log_ruido[mes] = persistencia * log_ruido[mes - 1] + choques[mes]
+
+    valores = np.clip(np.rint(media * ciclo * np.exp(log_ruido)), 1, VAZAO_MAXIMA).astype(int)
+    valores[num_meses - 12 + meses_ultimo_ano:] = 0
+
+    # (ano/mes x posto) -> (posto/ano x mes)
+    cubo = valores.reshape(num_anos, 12, len(postos)).transpose(2, 0, 1)
+    index = pd.MultiIndex.from_product([postos, np.arange(ano_inicial, ano_inicial + num_anos)],
+                                       names=['posto', 'ano'])
+    return pd.DataFrame(cubo.reshape(-1, 12),
+                        index=index,
+                        columns=pd.Index(np.arange(1, 13), name='mes'))
+
+
+def gerar_arquivo(arquivo_destino: Union[str, Path], **kwargs) -> Path:
+    """
+    Salva um arquivo vazoes.txt sintético.
+
+    Parameters
+    ----------
+    arquivo_destino : str or Path
+        Nome ou caminho do arquivo de destino.
+    **kwargs
+        Parâmetros de `gerar_df_arquivo`.
+
+    Returns
+    -------
+    Path
+        Caminho do arquivo gerado.
+
+    """
+    vazoes = VazoesTxt()
+    vazoes.df_arquivo = gerar_df_arquivo(**kwargs)
+    vazoes.salvar_txt(arquivo_destino)
+    return Path(arquivo_destino)
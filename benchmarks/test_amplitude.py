@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Índice das razões do teste da amplitude comparado com o cálculo completo,
+nos arquivos sintéticos dos benchmarks.
+"""
+import numpy as np
+import pytest
+
+from amp.script import ModeloCamila
+from amplitude import IndiceRazao
+import v
+
+
+def _assert_mesmo_indice(indice: IndiceRazao, esperado: IndiceRazao) -> None:
+    np.testing.assert_array_equal(indice.minimo, esperado.minimo)
+    np.testing.assert_array_equal(indice.maximo, esperado.maximo)
+
+
+@pytest.mark.parametrize('parcial', [False, True], ids=['todos_postos', 'postos_parciais'])
+@pytest.mark.parametrize('inplace', [False, True])
+def test_indice_razao_incremental(arquivo, posto, inplace, parcial):
+    vazoes = v.VazoesTxt(arquivo)
+    vazoes.indice_razao()
+    previsao = ModeloCamila(coluna=posto).fit(vazoes.df_period).predict()
+    if parcial:
+        # Novos meses de apenas alguns postos: os demais ficam zerados
+        previsao = previsao[previsao.columns[::2]]
+
+    for _ in range(2):
+        if inplace:
+            vazoes.add_novo_periodo(previsao, inplace=True)
+        else:
+            vazoes = vazoes.add_novo_periodo(previsao)
+
+        _assert_mesmo_indice(vazoes.indice_razao(),
+                             IndiceRazao.from_df_period(vazoes.df_period))
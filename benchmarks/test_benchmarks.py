@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks (pytest-benchmark) das etapas principais, de 10 a 999 postos.
+
+As funções com sufixo `_pandas` medem a implementação original pelo pandas,
+mantida como alternativa, para comparação com a implementação atual.
+"""
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from amp.script import ModeloCamila  # noqa: E402
+from cache_correlacao import CACHE_CORRELACAO  # noqa: E402
+from modelos import calc_corr_last12  # noqa: E402
+import v  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def modelo(vazoes, posto):
+    return ModeloCamila(coluna=posto).fit(vazoes.df_period)
+
+
+@pytest.mark.benchmark(group='leitura')
+def test_ler_arquivo(benchmark, arquivo):
+    benchmark(v.ler_arquivo_vazoes_txt, arquivo)
+
+
+@pytest.mark.benchmark(group='leitura')
+def test_ler_arquivo_pandas(benchmark, arquivo):
+    benchmark(v._ler_arquivo_vazoes_csv, arquivo)
+
+
+@pytest.mark.benchmark(group='leitura')
+def test_abrir_sob_demanda(benchmark, arquivo):
+    benchmark(v.VazoesTxt, arquivo, sob_demanda=True)
+
+
+@pytest.mark.benchmark(group='periodizar')
+def test_periodizar(benchmark, vazoes):
+    benchmark(v._periodizar_df_arq, vazoes.df_arquivo)
+
+
+@pytest.mark.benchmark(group='periodizar')
+def test_periodizar_pandas(benchmark, vazoes):
+    benchmark(v._periodizar_df_arq_pandas, vazoes.df_arquivo)
+
+
+@pytest.mark.benchmark(group='correlacao')
+def test_calc_corr_last12(benchmark, vazoes):
+    benchmark(calc_corr_last12, vazoes.df_period)
+
+
+@pytest.mark.benchmark(group='fit')
+def test_fit(benchmark, vazoes, posto):
+    # O cache de correlações é esvaziado antes de cada rodada, para medir o
+    # fit completo
+    benchmark.pedantic(lambda: ModeloCamila(coluna=posto).fit(vazoes.df_period),
+                       setup=CACHE_CORRELACAO.limpar,
+                       rounds=20)
+
+
+@pytest.mark.benchmark(group='predict')
+def test_predict(benchmark, modelo):
+    benchmark(modelo.predict)
+
+
+@pytest.mark.benchmark(group='add_novo_periodo')
+def test_add_novo_periodo(benchmark, vazoes, modelo):
+    benchmark(vazoes.add_novo_periodo, modelo.predict())
+
+
+@pytest.mark.benchmark(group='salvar_txt')
+def test_salvar_txt(benchmark, vazoes, tmp_path):
+    # df_arquivo é criado antes, para medir apenas a escrita
+    vazoes.df_arquivo
+    benchmark(vazoes.salvar_txt, tmp_path / 'VAZOES.txt')
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Invalidação dos caches quando os dados mudam."""
+import os
+
+import numpy as np
+import pandas as pd
+
+import cache_correlacao
+from benchmarks.sintetico import gerar_arquivo
+from cache_correlacao import CacheCorrelacao
+from modelos import calc_corr_last12
+import v
+
+
+def _regravar(vazoes: v.VazoesTxt, arquivo) -> None:
+    """Regrava o arquivo com uma data de modificação posterior à anterior."""
+    mtime_ns = os.stat(arquivo).st_mtime_ns
+    vazoes.salvar_txt(arquivo)
+    # Mesmo em sistemas de arquivos com baixa resolução de data
+    os.utime(arquivo, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+
+
+def test_cache_binario_invalidado(tmp_path):
+    arquivo = gerar_arquivo(tmp_path / 'VAZOES.txt')
+    original = v.VazoesTxt(arquivo, usar_cache=True).df_period.copy()
+    assert v.VazoesTxt(arquivo, usar_cache=True).df_period.equals(original)
+
+    # Um valor alterado, com o mesmo tamanho de arquivo
+    alterado = original.copy()
+    alterado.iloc[0, 0] += 1
+    _regravar(v.VazoesTxt.from_df_period(alterado), arquivo)
+    assert v.VazoesTxt(arquivo, usar_cache=True).df_period.equals(alterado)
+
+    # Um mês a mais
+    estendido = v.VazoesTxt.from_df_period(alterado).add_novo_periodo(alterado.iloc[-1:])
+    _regravar(estendido, arquivo)
+    vazoes = v.VazoesTxt(arquivo, usar_cache=True)
+    assert vazoes.df_period.equals(estendido.df_period)
+    # O cache refeito é usado na leitura seguinte
+    assert v.VazoesTxt(arquivo).carregar_cache()
+
+
+def test_cache_correlacao_invalidado(vazoes, monkeypatch):
+    # Quantidade de meses de cada tabela calculada (e não obtida do cache)
+    calculos = list()
+
+    def calc_contado(df_period):
+        calculos.append(len(df_period))
+        return calc_corr_last12(df_period)
+
+    monkeypatch.setattr(cache_correlacao, 'calc_corr_last12', calc_contado)
+    cache = CacheCorrelacao()
+
+    df_period = vazoes.df_period
+    primeira = cache.obter(df_period)
+    assert cache.obter(df_period) is primeira
+    # Mesmos valores com outro dtype: mesma chave
+    assert cache.obter(df_period.astype(np.int64)) is primeira
+    assert calculos == [len(df_period)]
+
+    # Um valor alterado
+    alterado = df_period.copy()
+    alterado.iloc[-1, 0] += 1
+    pd.testing.assert_frame_equal(cache.obter(alterado), calc_corr_last12(alterado))
+    assert calculos == [len(df_period)] * 2
+
+    # Um mês a mais
+    estendido = v.VazoesTxt.from_df_period(df_period).add_novo_periodo(df_period.iloc[-1:]).df_period
+    pd.testing.assert_frame_equal(cache.obter(estendido), calc_corr_last12(estendido))
+    assert calculos == [len(df_period)] * 2 + [len(df_period) + 1]
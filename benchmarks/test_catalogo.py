@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Catálogo de um diretório de arquivos sintéticos: releitura dos arquivos
+alterados e agrupamento por horizonte.
+"""
+import os
+
+from benchmarks.sintetico import gerar_arquivo
+from catalogo import Catalogo
+
+
+def test_atualizar(tmp_path):
+    gerar_arquivo(tmp_path / 'a.txt', num_postos=10, meses_ultimo_ano=4)
+    gerar_arquivo(tmp_path / 'b.txt', num_postos=20, meses_ultimo_ano=4, semente=1)
+    (tmp_path / 'sub').mkdir()
+    gerar_arquivo(tmp_path / 'sub' / 'c.txt', num_postos=10, num_anos=80)
+    (tmp_path / 'leia-me.txt').write_text('não é um arquivo de vazões\n')
+
+    catalogo = Catalogo(tmp_path).atualizar()
+    assert catalogo.alterados == ['a.txt', 'b.txt', 'sub/c.txt']
+    assert catalogo.ignorados == ['leia-me.txt']
+
+    tabela = catalogo.tabela()
+    assert list(tabela.index) == ['a.txt', 'b.txt', 'sub/c.txt']
+    assert list(tabela['num_postos']) == [10, 20, 10]
+    assert list(tabela['ano_inicial']) == [1931, 1931, 1931]
+    assert list(tabela['ano_final']) == [2020, 2020, 2010]
+    assert list(tabela['horizonte']) == ['2020-04', '2020-04', '2010-04']
+    assert catalogo.por_horizonte() == {'2020-04': [tmp_path / 'a.txt', tmp_path / 'b.txt'],
+                                        '2010-04': [tmp_path / 'sub' / 'c.txt']}
+
+    # Sem alterações, nenhum arquivo é lido novamente, mesmo pelo índice salvo
+    catalogo.salvar()
+    catalogo = Catalogo(tmp_path).atualizar()
+    assert catalogo.alterados == []
+    assert catalogo.removidos == []
+
+    # Um arquivo reescrito com outro horizonte e outro removido
+    stat = (tmp_path / 'b.txt').stat()
+    gerar_arquivo(tmp_path / 'b.txt', num_postos=20, meses_ultimo_ano=7, semente=1)
+    os.utime(tmp_path / 'b.txt', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    (tmp_path / 'sub' / 'c.txt').unlink()
+
+    catalogo.atualizar()
+    assert catalogo.alterados == ['b.txt']
+    assert catalogo.removidos == ['sub/c.txt']
+    assert catalogo.arquivos['b.txt'].horizonte == '2020-07'
+    assert catalogo.por_horizonte() == {'2020-04': [tmp_path / 'a.txt'],
+                                        '2020-07': [tmp_path / 'b.txt']}
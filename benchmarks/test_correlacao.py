@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Correlações dos últimos 12 meses comparadas com o cálculo completo, nos
+arquivos sintéticos dos benchmarks.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from amp.script import ModeloCamila
+from benchmarks.sintetico import gerar_df_arquivo
+from modelos import RankingCorrelacao, calc_corr_last12
+import v
+
+
+def _assert_mesmas_correlacoes(df_corr: pd.DataFrame,
+                               esperado: pd.DataFrame,
+                               tolerancia: float = 1e-12) -> None:
+    """Mesmos períodos e postos, mesmas correlações e NaN nas mesmas posições."""
+    pd.testing.assert_index_equal(df_corr.index, esperado.index)
+    pd.testing.assert_index_equal(df_corr.columns, esperado.columns)
+    np.testing.assert_allclose(df_corr.to_numpy(), esperado.to_numpy(), rtol=0, atol=tolerancia)
+
+
+def _calc_corr_last12_pandas(df_period: pd.DataFrame) -> pd.DataFrame:
+    """Correlação janela a janela pelo `corr` do pandas."""
+    ultimos = df_period.iloc[-12:].reset_index(drop=True)
+    linhas = dict()
+    for fim in range(11, len(df_period)):
+        if df_period.index[fim].month != df_period.index[-1].month:
+            continue
+        janela = df_period.iloc[fim - 11:fim + 1].reset_index(drop=True)
+        linhas[df_period.index[fim]] = {posto: janela[posto].corr(ultimos[posto])
+                                        for posto in df_period.columns}
+
+    df_corr = pd.DataFrame.from_dict(linhas, orient='index')
+    df_corr.index.name = df_period.index.name
+    df_corr.columns.name = df_period.columns.name
+    return df_corr
+
+
+def test_calc_corr_last12():
+    df_period = v._periodizar_df_arq(gerar_df_arquivo(num_postos=10)).copy()
+    # Uma janela anterior constante no segundo posto, e os últimos 12 meses
+    # constantes no terceiro: correlações NaN
+    df_period.iloc[-36:-24, 1] = 500
+    df_period.iloc[-12:, 2] = 500
+
+    esperado = _calc_corr_last12_pandas(df_period)
+    assert esperado.iloc[-3, 1] != esperado.iloc[-3, 1]
+    assert esperado.iloc[:, 2].isna().all()
+
+    _assert_mesmas_correlacoes(calc_corr_last12(df_period), esperado)
+    _assert_mesmas_correlacoes(v.VazoesTxt.from_df_period(df_period).calc_corr_last12(), esperado)
+
+
+@pytest.mark.parametrize('inplace', [False, True])
+def test_correlacao_incremental(arquivo, posto, inplace):
+    vazoes = v.VazoesTxt(arquivo)
+    vazoes.calc_corr_last12()
+    previsao = ModeloCamila(coluna=posto).fit(vazoes.df_period).predict()
+
+    for _ in range(3):
+        if inplace:
+            vazoes.add_novo_periodo(previsao, inplace=True)
+        else:
+            vazoes = vazoes.add_novo_periodo(previsao)
+
+        # O estado incremental usa somas inteiras, exatas; a diferença é o
+        # arredondamento das somas acumuladas de calc_corr_last12
+        _assert_mesmas_correlacoes(vazoes.calc_corr_last12(),
+                                   calc_corr_last12(vazoes.df_period),
+                                   tolerancia=1e-10)
+
+
+@pytest.mark.parametrize('inplace', [False, True])
+def test_correlacao_incremental_postos_parciais(arquivo, posto, inplace):
+    vazoes = v.VazoesTxt(arquivo)
+    vazoes.calc_corr_last12()
+    # Novos meses de apenas alguns postos: os demais ficam zerados
+    previsao = ModeloCamila(coluna=posto).fit(vazoes.df_period).predict()
+    previsao = previsao[previsao.columns[::2]]
+
+    resultado = vazoes.add_novo_periodo(previsao, inplace=inplace)
+    if not inplace:
+        vazoes = resultado
+
+    assert (vazoes.df_period.iloc[-len(previsao):, 1::2] == 0).all().all()
+    _assert_mesmas_correlacoes(vazoes.calc_corr_last12(),
+                               calc_corr_last12(vazoes.df_period),
+                               tolerancia=1e-10)
+
+
+@pytest.mark.parametrize('k', [1, 6, 11, 200])
+def test_ranking_correlacao(k):
+    # Correlações com muitos empates e alguns NaN
+    rng = np.random.default_rng(0)
+    valores = rng.integers(-4, 5, (90, 5)) / 4
+    valores[rng.random(valores.shape) < 0.1] = np.nan
+    df_corr = pd.DataFrame(valores,
+                           index=pd.period_range('1931-04', periods=90, freq='12M', name='mes'),
+                           columns=pd.Index([6, 74, 169, 275, 300], name='posto'))
+
+    ranking = RankingCorrelacao(df_corr, [275, 6, 169], k=k)
+    for coluna in ranking.colunas:
+        esperado = df_corr[coluna].sort_values(ascending=False, kind='stable').index
+        # Pedidos em blocos crescentes, estendendo o ranking aos poucos
+        periodos = [ranking.periodos(coluna, inicio, inicio + 7)
+                    for inicio in range(0, len(df_corr), 7)]
+        pd.testing.assert_index_equal(periodos[0].append(periodos[1:]), esperado)
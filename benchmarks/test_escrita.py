@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Escrita dos arquivos de vazões comparada com a escrita original, linha a
+linha, nos arquivos sintéticos dos benchmarks.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from amp.script import ModeloCamila
+from benchmarks.sintetico import gerar_df_arquivo
+import v
+
+
+def _salvar_txt_original(df_arquivo: pd.DataFrame, arquivo_destino: Path) -> None:
+    """Escrita linha a linha, como antes da formatação vetorizada."""
+    lista_linhas = list()
+    for idx, row in df_arquivo.iterrows():
+        lista_linhas.append(f"{idx[0]:3} {idx[1]:4}"
+                            f"{row[1]:6}{row[2]:6}{row[3]:6}"
+                            f"{row[4]:6}{row[5]:6}{row[6]:6}"
+                            f"{row[7]:6}{row[8]:6}{row[9]:6}"
+                            f"{row[10]:6}{row[11]:6}{row[12]:6}")
+
+    with open(arquivo_destino, 'w') as file:
+        file.write('\n'.join(lista_linhas))
+        file.write('\n')
+
+
+def test_salvar_txt(num_postos, tmp_path):
+    vazoes = v.VazoesTxt()
+    vazoes.df_arquivo = gerar_df_arquivo(num_postos=num_postos)
+    vazoes.salvar_txt(tmp_path / 'novo.txt')
+    _salvar_txt_original(vazoes.df_arquivo, tmp_path / 'original.txt')
+
+    assert (tmp_path / 'novo.txt').read_bytes() == (tmp_path / 'original.txt').read_bytes()
+
+
+def test_salvar_cenarios(vazoes, posto, tmp_path):
+    previsao = ModeloCamila(coluna=posto).fit(vazoes.df_period).predict()
+
+    cenarios = v.CenariosVazoes.from_dfs(vazoes, [previsao])
+    cenarios.salvar_todos([tmp_path / 'novo.txt'])
+    estendido = vazoes.add_novo_periodo(previsao)
+    _salvar_txt_original(estendido.df_arquivo, tmp_path / 'original.txt')
+
+    assert (tmp_path / 'novo.txt').read_bytes() == (tmp_path / 'original.txt').read_bytes()
+
+
+@pytest.mark.parametrize('meses_base', [4, 12])
+def test_salvar_cenario_fora_do_campo(meses_base, tmp_path):
+    # Um posto e um único ano final, com uma vazão maior que o campo
+    index = pd.period_range('2000-01', periods=meses_base, freq='M', name='mes')
+    vazoes = v.VazoesTxt.from_df_period(pd.DataFrame({6: np.arange(1, meses_base + 1)},
+                                                     index=index))
+    previsao = pd.DataFrame({6: [1234567, 5, 5]},
+                            index=pd.period_range('2030-01', periods=3, freq='M'))
+
+    v.CenariosVazoes.from_dfs(vazoes, [previsao]).salvar_txt(0, tmp_path / 'novo.txt')
+    _salvar_txt_original(vazoes.add_novo_periodo(previsao).df_arquivo, tmp_path / 'original.txt')
+
+    assert (tmp_path / 'novo.txt').read_bytes() == (tmp_path / 'original.txt').read_bytes()
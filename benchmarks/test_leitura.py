@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Leitura e conversão entre os formatos comparadas com as versões pelo pandas,
+nos arquivos sintéticos dos benchmarks.
+"""
+import pandas as pd
+
+import v
+
+
+def test_ler_arquivo(arquivo):
+    # A leitura direta usa int32; a leitura pelo pandas deixa os valores em
+    # int64 e as colunas dos meses com dtype object
+    pd.testing.assert_frame_equal(v.ler_arquivo_vazoes_txt(arquivo),
+                                  v._ler_arquivo_vazoes_csv(arquivo),
+                                  check_dtype=False,
+                                  check_column_type=False)
+
+
+def test_periodizar(arquivo):
+    df_arquivo = v._ler_arquivo_vazoes_csv(arquivo)
+    pd.testing.assert_frame_equal(v._periodizar_df_arq(df_arquivo),
+                                  v._periodizar_df_arq_pandas(df_arquivo))
+
+
+def test_desperiodizar(arquivo):
+    df_arquivo = v._ler_arquivo_vazoes_csv(arquivo)
+    df_period = v._periodizar_df_arq_pandas(df_arquivo)
+    ano_final = df_arquivo.index.get_level_values('ano').max()
+    pd.testing.assert_frame_equal(v._desperiodizar_df_arq(df_period, ano_final),
+                                  v._desperiodizar_df_arq_pandas(df_period, ano_final))
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""Execução em lote sobre diretórios de arquivos sintéticos."""
+import shutil
+
+import lote
+
+
+def test_lote_vazio(tmp_path):
+    df_anos = lote.executar_lote(lote.listar_arquivos(tmp_path),
+                                 processos=1,
+                                 diretorio_base=tmp_path)
+
+    assert df_anos.index.to_list() == list(lote.POSTOS_PRINCIPAIS)
+    assert df_anos.columns.empty
+
+
+def test_lote_subpastas(arquivo, tmp_path):
+    # Arquivos com o mesmo nome em subpastas diferentes
+    for pasta in ['a', 'b']:
+        (tmp_path / pasta).mkdir()
+        shutil.copy(arquivo, tmp_path / pasta / 'VAZOES.txt')
+
+    df_anos = lote.executar_lote(lote.listar_arquivos(tmp_path),
+                                 processos=1,
+                                 diretorio_base=tmp_path)
+
+    assert df_anos.columns.to_list() == ['a/VAZOES.txt', 'b/VAZOES.txt']
+    assert df_anos['a/VAZOES.txt'].equals(df_anos['b/VAZOES.txt'].rename('a/VAZOES.txt'))
+    assert df_anos.notna().all().all()
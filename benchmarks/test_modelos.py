@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Ajuste dos modelos comparado com o ajuste original, nos arquivos sintéticos
+dos benchmarks.
+"""
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from amp.script import ModeloCamila, ModeloMultiPosto
+from amplitude import APROVADO
+from benchmarks.sintetico import POSTOS_PRINCIPAIS, VAZAO_MAXIMA, gerar_df_arquivo
+from modelos import calc_corr_last12
+import v
+
+# Os scripts de seg 21.11 não formam um pacote
+sys.path.insert(0, str(Path(__file__).parents[1] / 'seg 21.11'))
+import model as seg_model  # noqa: E402
+
+
+def _ajustar_original(df_base: pd.DataFrame, coluna: int) -> tuple:
+    """
+    Fit original: ranking completo e teste da amplitude candidato a candidato.
+
+    Retorna a posição, o 'ano-mes' escolhido e se algum candidato passou.
+    """
+    top_corr = calc_corr_last12(df_base)[coluna].sort_values(ascending=False)
+    posicao = 1
+    for posicao_atual in range(1, 11):
+        periodo = top_corr.index[posicao_atual]
+        mes_escolhido_ini = periodo + 1
+        series_proximo_mes = df_base.loc[mes_escolhido_ini]
+        series_proximo_mes.name = df_base.index[-1] + 1
+        df_base_modif = pd.concat([df_base, series_proximo_mes.to_frame().T])
+
+        df_razao = df_base_modif.shift(1) / df_base_modif
+        df_razao = df_razao.replace([np.inf, np.nan], 0)
+        df_razao = df_razao[df_razao.index.month == mes_escolhido_ini.month]
+        razao_previsao = df_razao.iloc[-1, :]
+        razao_maxima = df_razao.iloc[:-1, :].max()
+        razao_minima = df_razao.iloc[:-1, :].min()
+
+        falhou = (razao_previsao[coluna] >= razao_maxima[coluna]
+                  or razao_previsao[coluna] <= razao_minima[coluna])
+        if not falhou:
+            return posicao_atual, periodo.strftime('%Y-%m'), True
+
+    # Nenhum candidato passou: fica o último período testado
+    return posicao, periodo.strftime('%Y-%m'), False
+
+
+def test_fit_original():
+    df_base = v._periodizar_df_arq(gerar_df_arquivo(num_postos=10)).copy()
+    # Último mês muito acima do histórico em um dos postos: nenhum candidato
+    # passa no teste da amplitude
+    df_base.iloc[-1, -1] = 100 * VAZAO_MAXIMA
+
+    casos = list()
+    for corte in range(0, 24, 5):
+        df_corte = df_base.iloc[:len(df_base) - corte]
+        for coluna in df_corte.columns:
+            model = ModeloCamila(coluna=coluna).fit(df_corte)
+            posicao, mes_final_periodo, passou = _ajustar_original(df_corte, coluna)
+            assert (model.posicao, model.mes_final_periodo_) == (posicao, mes_final_periodo)
+            casos.append((posicao, passou))
+
+    # Casos em que o primeiro candidato falha e em que nenhum passa
+    assert any(posicao > 1 for posicao, passou in casos)
+    assert any(not passou for posicao, passou in casos)
+
+
+def test_qualquer_coisa():
+    df_base = v._periodizar_df_arq(gerar_df_arquivo(num_postos=10))
+
+    for corte in range(0, 24, 5):
+        df_corte = df_base.iloc[:len(df_base) - corte]
+        for coluna in df_corte.columns:
+            model = ModeloCamila(coluna=coluna).fit(df_corte)
+            # Como no fit original: apenas se o primeiro candidato falhou
+            if model.motivos_[0] == APROVADO:
+                assert not hasattr(model, 'qualquer_coisa')
+                continue
+            top_corr = calc_corr_last12(df_corte)[coluna].sort_values(ascending=False)
+            pd.testing.assert_index_equal(model.qualquer_coisa, top_corr.head(11).index)
+
+
+@pytest.mark.parametrize('postos_amplitude', [None, POSTOS_PRINCIPAIS])
+def test_multiposto(postos_amplitude):
+    df_base = v._periodizar_df_arq(gerar_df_arquivo(num_postos=10))
+
+    for corte in range(0, 60, 7):
+        df_corte = df_base.iloc[:len(df_base) - corte]
+        multi = ModeloMultiPosto(POSTOS_PRINCIPAIS, postos_amplitude=postos_amplitude).fit(df_corte)
+        for posto, model in multi.modelos_.items():
+            separado = ModeloCamila(coluna=posto, postos_amplitude=postos_amplitude).fit(df_corte)
+            assert model.posicao == separado.posicao
+            assert model.mes_final_periodo_ == separado.mes_final_periodo_
+            assert model.correlacao_ == separado.correlacao_
+            np.testing.assert_array_equal(model.motivos_, separado.motivos_)
+            pd.testing.assert_frame_equal(model.aprovados_, separado.aprovados_)
+            pd.testing.assert_frame_equal(model.predict(), separado.predict())
+
+
+def test_ajustar_modelos():
+    # Arquivos diferentes, com anos candidatos em comum
+    lista_df_base = [v._periodizar_df_arq_pandas(gerar_df_arquivo(semente=semente))
+                     for semente in range(4)]
+
+    anos_usados = list()
+    for df_base in lista_df_base:
+        anos_usados.append(seg_model.ModeloCamila().fit(df_base, anos_usados).anos_)
+
+    modelos = seg_model.ajustar_modelos(lista_df_base, processos=min(2, os.cpu_count()))
+    assert [model.anos_ for model in modelos] == anos_usados
+    # Os modelos do ajuste em paralelo ficam no mesmo estado do fit
+    for model, df_base in zip(modelos, lista_df_base):
+        assert model.df_correlacao is not None
+        assert model.df_base.equals(df_base)
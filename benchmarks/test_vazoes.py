@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""Comportamento do VazoesTxt nos arquivos sintéticos dos benchmarks."""
+import shutil
+
+import pytest
+
+import v
+
+
+@pytest.mark.parametrize('usar_cache', [False, True])
+def test_df_period_somente_leitura(arquivo, usar_cache, tmp_path):
+    # Cópia do arquivo, para que o cache seja criado fora do diretório compartilhado
+    arquivo = shutil.copy(arquivo, tmp_path / 'VAZOES.txt')
+    # Na segunda leitura com cache, os dados vêm do cache mapeado em memória
+    for _ in range(2):
+        vazoes = v.VazoesTxt(arquivo, usar_cache=usar_cache)
+        with pytest.raises(ValueError):
+            vazoes.df_period.iloc[0, 0] = 1
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""Cache das correlações dos últimos 12 meses."""
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from modelos import calc_corr_last12
+
+# Variável de ambiente com o diretório do cache em disco (opcional)
+VAR_AMBIENTE_DIRETORIO = 'VAVA_CACHE_CORRELACAO'
+
+
+def chave_df_period(df_period: pd.DataFrame) -> str:
+    """
+    Hash do conteúdo de um dataframe 'periodizado'.
+
+    Considera os valores, os períodos e os postos, de forma que dois arquivos
+    com o mesmo conteúdo tenham a mesma chave. Os valores são convertidos
+    para float antes do hash, como no cálculo das correlações: dados int32,
+    int64 ou float com os mesmos números têm a mesma chave.
+
+    Parameters
+    ----------
+    df_period : DataFrame
+        Dados 'periodizados' (ano/mes x posto).
+
+    Returns
+    -------
+    str
+        Chave hexadecimal.
+
+    """
+    # Exato para as vazões inteiras; + 0.0 iguala -0.0 e 0.0
+    valores = np.ascontiguousarray(df_period.to_numpy(dtype=float) + 0.0)
+    hash_ = hashlib.blake2b(digest_size=20)
+    hash_.update(f"{valores.dtype.str}{valores.shape}".encode())
+    hash_.update(valores.tobytes())
+    hash_.update(np.asarray(df_period.index.asi8, dtype=np.int64).tobytes())
+    hash_.update(repr(df_period.columns.to_list()).encode())
+    return hash_.hexdigest()
+
+
+class CacheCorrelacao:
+    """
+    Cache de `calc_corr_last12` em memória (LRU) e, opcionalmente, em disco.
+
+    O cache em disco guarda um arquivo .npz por chave, e pode ser reaproveitado
+    entre execuções diferentes.
+
+    Attributes
+    ----------
+    tamanho_max : int
+        Quantidade máxima de tabelas mantidas em memória.
+    diretorio : Path or None
+        Diretório do cache em disco. Se None, apenas a memória é usada.
+
+    """
+
+    def __init__(self,
+                 tamanho_max: int = 32,
+                 diretorio: Optional[Union[str, Path]] = None):
+        """
+        Criação do cache.
+
+        Parameters
+        ----------
+        tamanho_max : int, optional
+            Quantidade máxima de tabelas em memória. O default é 32.
+        diretorio : str or Path, optional
+            Diretório do cache em disco.
+
+        """
+        self.tamanho_max = tamanho_max
+        self.diretorio = Path(diretorio) if diretorio else None
+        self._memoria: 'OrderedDict[str, pd.DataFrame]' = OrderedDict()
+
+    def obter(self, df_period: pd.DataFrame) -> pd.DataFrame:
+        """
+        Tabela de correlações do dataframe, calculando apenas se necessário.
+
+        A tabela retornada é compartilhada pelo cache e não deve ser alterada.
+
+        Parameters
+        ----------
+        df_period : DataFrame
+            Dados 'periodizados' (ano/mes x posto).
+
+        Returns
+        -------
+        DataFrame
+            Mesmo resultado de `calc_corr_last12(df_period)`.
+
+        """
+        chave = chave_df_period(df_period)
+
+        df_corr = self._memoria.get(chave)
+        if df_corr is not None:
+            self._memoria.move_to_end(chave)
+            return df_corr
+
+        df_corr = self._ler_disco(chave)
+        if df_corr is None:
+            df_corr = calc_corr_last12(df_period)
+            self._salvar_disco(chave, df_corr)
+
+        self._guardar_memoria(chave, df_corr)
+
+        return df_corr
+
+    def guardar(self, df_period: pd.DataFrame, df_corr: pd.DataFrame) -> None:
+        """
+        Registra uma tabela já calculada (por exemplo, de forma incremental).
+
+        Parameters
+        ----------
+        df_period : DataFrame
+            Dados 'periodizados' (ano/mes x posto).
+        df_corr : DataFrame
+            Mesmo resultado de `calc_corr_last12(df_period)`.
+
+        """
+        self._guardar_memoria(chave_df_period(df_period), df_corr)
+
+    def limpar(self) -> None:
+        """Esvazia o cache em memória (o cache em disco é mantido)."""
+        self._memoria.clear()
+
+    def _guardar_memoria(self, chave: str, df_corr: pd.DataFrame) -> None:
+        self._memoria[chave] = df_corr
+        while len(self._memoria) > self.tamanho_max:
+            self._memoria.popitem(last=False)
+
+    def _caminho(self, chave: str) -> Path:
+        return self.diretorio / f"corr_{chave}.npz"
+
+    def _ler_disco(self, chave: str) -> Optional[pd.DataFrame]:
+        if self.diretorio is None or not self._caminho(chave).exists():
+            return None
+
+        with np.load(self._caminho(chave), allow_pickle=False) as dados:
+            periodos = dados['periodos']
+            # Reconstrói o PeriodIndex a partir dos ordinais
+            index = pd.period_range(pd.Period(ordinal=int(periodos.min()), freq='M'),
+                                    periods=int(periodos.max() - periodos.min()) + 1,
+                                    freq='M',
+                                    name='mes')[periodos - periodos.min()]
+            return pd.DataFrame(dados['corr'],
+                                index=index,
+                                columns=pd.Index(dados['postos'], name='posto'))
+
+    def _salvar_disco(self, chave: str, df_corr: pd.DataFrame) -> None:
+        if self.diretorio is None:
+            return
+
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        # Grava em um arquivo temporário para que outro processo nunca leia
+        # um arquivo incompleto
+        temporario = self._caminho(chave).with_suffix(f".{os.getpid()}.tmp")
+        with open(temporario, 'wb') as file:
+            np.savez(file,
+                     corr=df_corr.to_numpy(dtype=float),
+                     periodos=df_corr.index.asi8,
+                     postos=df_corr.columns.to_numpy())
+        os.replace(temporario, self._caminho(chave))
+
+
+# Cache compartilhado pelos modelos
+CACHE_CORRELACAO = CacheCorrelacao(diretorio=os.environ.get(VAR_AMBIENTE_DIRETORIO))
+
+
+def calc_corr_last12_cache(df_period: pd.DataFrame) -> pd.DataFrame:
+    """
+    `calc_corr_last12` usando o cache compartilhado `CACHE_CORRELACAO`.
+
+    Parameters
+    ----------
+    df_period : DataFrame
+        Dados 'periodizados' (ano/mes x posto).
+
+    Returns
+    -------
+    DataFrame
+        Correlações (período final da janela x posto).
+
+    """
+    return CACHE_CORRELACAO.obter(df_period)
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""
+Catálogo dos arquivos de vazões de um diretório.
+
+Os metadados de cada arquivo (postos, primeiro e último ano, último mês
+preenchido, tamanho e hash do conteúdo) são obtidos sem interpretar os
+dados: apenas a primeira e a última linha são lidas, e os postos e o último
+mês preenchido vêm da primeira e da última linha de cada bloco, localizadas
+pela largura fixa das linhas. O catálogo é salvo em um pequeno arquivo de
+índice, e em uma nova varredura apenas os arquivos com data de modificação
+ou tamanho diferentes são lidos novamente.
+
+Uso:
+    python catalogo.py <diretorio> [--padrao '*.txt'] [--indice ARQ.json]
+"""
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+# Nome default do arquivo de índice, no próprio diretório
+ARQUIVO_INDICE = '.catalogo_vazoes.json'
+# Versão do formato do índice
+VERSAO_INDICE = 2
+# Tamanho dos blocos lidos no cálculo do hash
+BYTES_POR_LEITURA = 1 << 20
+
+
+class MetadadosArquivo:
+    """
+    Metadados de um arquivo de vazões.
+
+    Attributes
+    ----------
+    tamanho : int
+        Tamanho do arquivo (bytes).
+    mtime_ns : int
+        Data de modificação (ns).
+    hash : str
+        Hash (blake2b) do conteúdo.
+    postos : list of int
+        Postos do arquivo, na ordem em que aparecem.
+    ano_inicial : int
+        Ano da primeira linha.
+    ano_final : int
+        Ano da última linha.
+    ano_ultimo_mes : int
+        Ano do último mês com vazão diferente de zero em algum posto.
+    ultimo_mes : int
+        Último mês com vazão diferente de zero em algum posto (0 se nenhum).
+        Os meses posteriores, zerados em todos os postos, não fazem parte
+        dos dados 'periodizados'.
+
+    """
+
+    _CAMPOS = ('tamanho', 'mtime_ns', 'hash', 'postos',
+               'ano_inicial', 'ano_final', 'ano_ultimo_mes', 'ultimo_mes')
+
+    def __init__(self, **campos):
+        for campo in self._CAMPOS:
+            setattr(self, campo, campos[campo])
+
+    def para_dict(self) -> dict:
+        """Campos do objeto, para o arquivo de índice."""
+        return {campo: getattr(self, campo) for campo in self._CAMPOS}
+
+    @classmethod
+    def de_dict(cls, campos: dict) -> 'MetadadosArquivo':
+        """Construtor a partir dos campos lidos do arquivo de índice."""
+        return cls(**campos)
+
+    @property
+    def horizonte(self) -> str:
+        """'Ano-mes' do último mês preenchido, o final de df_period."""
+        return f"{self.ano_ultimo_mes}-{self.ultimo_mes:02d}"
+
+
+def _hash_arquivo(arquivo: Path) -> str:
+    """Hash do conteúdo do arquivo, lido em blocos."""
+    hash_ = hashlib.blake2b(digest_size=20)
+    with open(arquivo, 'rb') as file:
+        while bloco := file.read(BYTES_POR_LEITURA):
+            hash_.update(bloco)
+    return hash_.hexdigest()
+
+
+def _campos_linha(linha: bytes) -> List[int]:
+    """Posto, ano e os doze meses de uma linha."""
+    campos = [int(campo) for campo in linha.split()]
+    if len(campos) != 14:
+        raise ValueError(f"Linha fora do formato do arquivo de vazões: {linha!r}")
+    return campos
+
+
+def _ultimo_mes_preenchido(campos: List[int]) -> int:
+    """Último mês com vazão diferente de zero de uma linha (0 se nenhum)."""
+    meses_preenchidos = [mes for mes, vazao in enumerate(campos[2:], start=1) if vazao != 0]
+    return meses_preenchidos[-1] if meses_preenchidos else 0
+
+
+def _postos_largura_fixa(file,
+                         tamanho: int,
+                         largura: int,
+                         ano_inicial: int,
+                         ano_final: int,
+                         ) -> Optional[Tuple[List[int], Tuple[int, int]]]:
+    """
+    Postos e último mês preenchido de um arquivo regular.
+
+    Os postos vêm da primeira e da última linha de cada bloco. O último mês
+    considera a última linha de todos os blocos, recuando um ano enquanto
+    todos os postos estiverem zerados.
+
+    Returns
+    -------
+    tuple or None
+        Postos e (ano, mês) do último mês preenchido, ou None se as linhas
+        não tiverem a mesma largura ou se os postos não tiverem todos os anos
+        do arquivo.
+
+    """
+    num_anos = ano_final - ano_inicial + 1
+    if tamanho % largura or num_anos <= 0 or (tamanho // largura) % num_anos:
+        return None
+
+    inicios = range(0, tamanho // largura, num_anos)
+    postos = list()
+    for inicio in inicios:
+        file.seek(inicio * largura)
+        primeira = _campos_linha(file.read(largura))
+        file.seek((inicio + num_anos - 1) * largura)
+        ultima = _campos_linha(file.read(largura))
+        if (primeira[1], ultima[1], ultima[0]) != (ano_inicial, ano_final, primeira[0]):
+            return None
+        postos.append(primeira[0])
+
+    for recuo in range(num_anos):
+        ultimo_mes = 0
+        for inicio in inicios:
+            file.seek((inicio + num_anos - 1 - recuo) * largura)
+            ultimo_mes = max(ultimo_mes, _ultimo_mes_preenchido(_campos_linha(file.read(largura))))
+        if ultimo_mes:
+            return postos, (ano_final - recuo, ultimo_mes)
+
+    return postos, (ano_inicial, 0)
+
+
+def _postos_todas_linhas(file) -> Tuple[List[int], Tuple[int, int]]:
+    """Postos e último mês preenchido de um arquivo qualquer, lendo todas as linhas."""
+    file.seek(0)
+    postos = dict()
+    ultimo = (0, 0)
+    for linha in file:
+        if not linha.strip():
+            continue
+        campos = _campos_linha(linha)
+        postos.setdefault(campos[0], None)
+        ultimo_mes = _ultimo_mes_preenchido(campos)
+        if ultimo_mes:
+            ultimo = max(ultimo, (campos[1], ultimo_mes))
+    return list(postos), ultimo
+
+
+def ler_metadados(arquivo: Union[str, Path], calcular_hash: bool = True) -> MetadadosArquivo:
+    """
+    Metadados de um arquivo de vazões, sem interpretar os dados.
+
+    Parameters
+    ----------
+    arquivo : str or Path
+        Nome ou caminho do arquivo de vazões.txt.
+    calcular_hash : bool, optional
+        Se False, o hash (que exige ler todo o arquivo) fica como None. O
+        default é True.
+
+    Returns
+    -------
+    MetadadosArquivo
+        Metadados do arquivo.
+
+    Raises
+    ------
+    ValueError
+        Se o arquivo estiver vazio ou a primeira ou a última linha não
+        estiverem no formato do arquivo de vazões.
+
+    """
+    arquivo = Path(arquivo)
+    stat = arquivo.stat()
+
+    with open(arquivo, 'rb') as file:
+        primeira_linha = file.readline()
+        if not primeira_linha.strip():
+            raise ValueError(f"Arquivo vazio: {arquivo}")
+        largura = len(primeira_linha)
+
+        # A última linha está nos últimos bytes (com ou sem quebra de linha)
+        file.seek(max(stat.st_size - max(4 * largura, 4096), 0))
+        ultima_linha = file.read().rstrip().rsplit(b'\n', 1)[-1]
+
+        primeira = _campos_linha(primeira_linha)
+        ultima = _campos_linha(ultima_linha)
+
+        # O último mês considera todos os postos: o último posto pode estar
+        # zerado
+        postos_ultimo = _postos_largura_fixa(file, stat.st_size, largura, primeira[1], ultima[1])
+        if postos_ultimo is None:
+            postos_ultimo = _postos_todas_linhas(file)
+        postos, (ano_ultimo_mes, ultimo_mes) = postos_ultimo
+
+    return MetadadosArquivo(tamanho=stat.st_size,
+                            mtime_ns=stat.st_mtime_ns,
+                            hash=_hash_arquivo(arquivo) if calcular_hash else None,
+                            postos=postos,
+                            ano_inicial=primeira[1],
+                            ano_final=ultima[1],
+                            ano_ultimo_mes=ano_ultimo_mes,
+                            ultimo_mes=ultimo_mes)
+
+
+class Catalogo:
+    """
+    Metadados de todos os arquivos de vazões de um diretório.
+
+    Attributes
+    ----------
+    diretorio : Path
+        Diretório com os arquivos de vazões (percorrido recursivamente).
+    padrao : str
+        Padrão do nome dos arquivos.
+    arquivo_indice : Path
+        Arquivo de índice em que o catálogo é salvo.
+    arquivos : dict
+        Metadados (MetadadosArquivo) por caminho relativo ao diretório.
+    alterados : list of str
+        Arquivos novos ou alterados na última atualização.
+    removidos : list of str
+        Arquivos do índice que não existem mais na última atualização.
+    ignorados : list of str
+        Arquivos que não estão no formato do arquivo de vazões.
+
+    """
+
+    def __init__(self,
+                 diretorio: Union[str, Path],
+                 padrao: str = '*.txt',
+                 arquivo_indice: Optional[Union[str, Path]] = None):
+        """
+        Criação do catálogo, lendo o arquivo de índice, se existir.
+
+        Parameters
+        ----------
+        diretorio : str or Path
+            Diretório com os arquivos de vazões.
+        padrao : str, optional
+            Padrão do nome dos arquivos. O default é '*.txt'.
+        arquivo_indice : str or Path, optional
+            Arquivo de índice. O default é ARQUIVO_INDICE no diretório.
+
+        """
+        self.diretorio = Path(diretorio)
+        self.padrao = padrao
+        self.arquivo_indice = (Path(arquivo_indice) if arquivo_indice
+                               else self.diretorio / ARQUIVO_INDICE)
+        self.arquivos: Dict[str, MetadadosArquivo] = dict()
+        self.alterados: List[str] = list()
+        self.removidos: List[str] = list()
+        self.ignorados: List[str] = list()
+
+        self.carregar()
+
+    def carregar(self) -> bool:
+        """
+        Lê o arquivo de índice.
+
+        Returns
+        -------
+        bool
+            True se o índice existia e está na versão atual.
+
+        """
+        try:
+            indice = json.loads(self.arquivo_indice.read_text(encoding='utf-8'))
+        except (FileNotFoundError, ValueError):
+            return False
+        if indice.get('versao') != VERSAO_INDICE:
+            return False
+
+        self.arquivos = {nome: MetadadosArquivo.de_dict(campos)
+                         for nome, campos in indice['arquivos'].items()}
+        return True
+
+    def atualizar(self) -> 'Catalogo':
+        """
+        Varre o diretório, lendo apenas os arquivos novos ou alterados.
+
+        Um arquivo é considerado alterado se a data de modificação ou o
+        tamanho forem diferentes dos registrados no índice.
+
+        Returns
+        -------
+            O próprio objeto: self.
+
+        """
+        anteriores = self.arquivos
+        self.arquivos = dict()
+        self.alterados = list()
+        self.ignorados = list()
+
+        for caminho in sorted(self.diretorio.rglob(self.padrao)):
+            if not caminho.is_file() or caminho == self.arquivo_indice:
+                continue
+            nome = caminho.relative_to(self.diretorio).as_posix()
+
+            stat = caminho.stat()
+            anterior = anteriores.get(nome)
+            if (anterior is not None
+                    and (anterior.mtime_ns, anterior.tamanho) == (stat.st_mtime_ns, stat.st_size)):
+                self.arquivos[nome] = anterior
+                continue
+
+            try:
+                self.arquivos[nome] = ler_metadados(caminho)
+            except ValueError:
+                self.ignorados.append(nome)
+                continue
+            self.alterados.append(nome)
+
+        self.removidos = sorted(set(anteriores) - set(self.arquivos))
+
+        return self
+
+    def salvar(self) -> Path:
+        """
+        Salva o catálogo no arquivo de índice.
+
+        Returns
+        -------
+        Path
+            Arquivo de índice.
+
+        """
+        indice = {'versao': VERSAO_INDICE,
+                  'arquivos': {nome: metadados.para_dict()
+                               for nome, metadados in self.arquivos.items()}}
+
+        # Grava em um arquivo temporário para que o índice nunca fique incompleto
+        temporario = self.arquivo_indice.with_suffix(f".{os.getpid()}.tmp")
+        temporario.write_text(json.dumps(indice), encoding='utf-8')
+        os.replace(temporario, self.arquivo_indice)
+
+        return self.arquivo_indice
+
+    def caminhos(self) -> List[Path]:
+        """Caminho de cada arquivo catalogado."""
+        return [self.diretorio / nome for nome in self.arquivos]
+
+    def tabela(self) -> pd.DataFrame:
+        """
+        Metadados de todos os arquivos.
+
+        Returns
+        -------
+        DataFrame
+            Uma linha por arquivo, com a quantidade de postos no lugar da
+            lista de postos.
+
+        """
+        df = pd.DataFrame([metadados.para_dict() for metadados in self.arquivos.values()],
+                          index=pd.Index(list(self.arquivos), name='arquivo'),
+                          columns=list(MetadadosArquivo._CAMPOS))
+        df['num_postos'] = df.pop('postos').map(len)
+        df['horizonte'] = [metadados.horizonte for metadados in self.arquivos.values()]
+        return df
+
+    def por_horizonte(self) -> Dict[str, List[Path]]:
+        """
+        Arquivos agrupados pelo último mês preenchido ('ano-mes').
+
+        Returns
+        -------
+        dict
+            Caminhos dos arquivos de cada horizonte.
+
+        """
+        grupos: Dict[str, List[Path]] = dict()
+        for nome, metadados in self.arquivos.items():
+            grupos.setdefault(metadados.horizonte, list()).append(self.diretorio / nome)
+        return grupos
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Interface de linha de comando."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('diretorio', type=Path,
+                        help="Diretório com os arquivos de vazões")
+    parser.add_argument('--padrao', default='*.txt',
+                        help="Padrão do nome dos arquivos (default: *.txt)")
+    parser.add_argument('--indice', type=Path, default=None,
+                        help=f"Arquivo de índice (default: <diretorio>/{ARQUIVO_INDICE})")
+    args = parser.parse_args(argv)
+
+    catalogo = Catalogo(args.diretorio, args.padrao, args.indice).atualizar()
+    catalogo.salvar()
+
+    print(catalogo.tabela().drop(columns=['mtime_ns', 'hash']).to_string())
+    print(f"\n{len(catalogo.alterados)} novos ou alterados, "
+          f"{len(catalogo.removidos)} removidos, {len(catalogo.ignorados)} ignorados")
+
+
+if __name__ == '__main__':
+    main()
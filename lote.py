@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+"""
+Execução em lote do Rolling Horizon.
+
+Ajusta os modelos dos postos principais de cada arquivo de vazões em
+paralelo, usando um processo por núcleo. Os postos de um mesmo arquivo são
+ajustados em conjunto, compartilhando correlações e teste da amplitude. Os
+dados de cada arquivo são lidos uma única vez e compartilhados com os
+processos por memória compartilhada, sem serializar dataframes.
+
+Os arquivos passam um de cada vez por leitura, ajuste, previsão e escrita,
+e apenas uma quantidade limitada fica em andamento: a memória usada não
+depende da quantidade de arquivos do lote.
+
+Uso:
+    python lote.py <diretorio> [--saida DIR] [--tabela ARQ.csv] [--processos N]
+                   [--em-andamento N] [--cache] [--perfil [ARQ.json]]
+                   [--telemetria ARQ.csv]
+"""
+import argparse
+import os
+from fnmatch import fnmatch
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from perfil import PERFIL
+from telemetria import TelemetriaBusca
+from v import CenariosVazoes, VazoesTxt, _periodos_de_ordinais
+
+# Postos principais
+POSTOS_PRINCIPAIS = {
+    6: 'FURNAS',
+    74: 'GBM',
+    169: 'SOBRADINHO',
+    275: 'TUCURUÍ',
+    }
+
+
+def listar_arquivos(caminho: Union[str, Path],
+                    padrao: str = '*.txt',
+                    ) -> Iterator[Path]:
+    """
+    Percorre recursivamente o diretório, retornando os arquivos de vazões.
+
+    Os arquivos são retornados à medida que cada diretório é lido, em ordem
+    alfabética dentro do diretório, e as subpastas entram na posição do seu
+    nome. É a ordem de `sorted` sobre os objetos Path, que comparam parte a
+    parte: uma pasta `a/` vem antes de `a.txt`, ao contrário da ordem dos
+    caminhos como texto.
+
+    Parameters
+    ----------
+    caminho : str or Path
+        Diretório com os arquivos de vazões.
+    padrao : str, optional
+        Padrão do nome dos arquivos. O default é '*.txt'.
+
+    """
+    with os.scandir(caminho) as entradas:
+        entradas = sorted(entradas, key=lambda entrada: entrada.name)
+
+    for entrada in entradas:
+        if entrada.is_dir(follow_symlinks=False):
+            yield from listar_arquivos(entrada.path, padrao)
+        elif entrada.is_file() and fnmatch(entrada.name, padrao):
+            yield Path(entrada.path).resolve()
+
+
+def nome_relativo(arquivo: Path, diretorio_base: Optional[Path] = None) -> str:
+    """
+    Nome que identifica o arquivo na tabela e nas saídas do lote.
+
+    Parameters
+    ----------
+    arquivo : Path
+        Arquivo de vazões.
+    diretorio_base : Path, optional
+        Diretório de entrada. Se informado, o nome é o caminho relativo a
+        ele (com as subpastas); caso contrário, apenas o nome do arquivo.
+
+    """
+    if diretorio_base is None:
+        return arquivo.name
+    return arquivo.resolve().relative_to(Path(diretorio_base).resolve()).as_posix()
+
+
+class DadosCompartilhados:
+    """
+    Dados 'periodizados' de um arquivo em memória compartilhada.
+
+    Apenas a descrição (nome do bloco, formato, períodos, postos e limites do
+    teste da amplitude) é enviada aos processos, que acessam os valores sem
+    cópia.
+
+    """
+
+    def __init__(self, vazoes: VazoesTxt):
+        """
+        Copia os valores do arquivo para um novo bloco compartilhado.
+
+        Parameters
+        ----------
+        vazoes : VazoesTxt
+            Dados do arquivo. Os limites do teste da amplitude são calculados
+            aqui, uma única vez, e enviados junto com a descrição.
+
+        """
+        df_period = vazoes.df_period
+        valores = df_period.to_numpy()
+        self._shm = shared_memory.SharedMemory(create=True, size=max(valores.nbytes, 1))
+        destino = np.ndarray(valores.shape, dtype=valores.dtype, buffer=self._shm.buf)
+        destino[:] = valores
+        del destino
+
+        self.descricao = {
+            'nome': self._shm.name,
+            'formato': valores.shape,
+            'dtype': valores.dtype.str,
+            'periodos': df_period.index.asi8,
+            'postos': df_period.columns.to_numpy(),
+            'indice_razao': vazoes.indice_razao(),
+        }
+
+    def liberar(self) -> None:
+        """Libera o bloco compartilhado."""
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _ajustar(descricao: dict,
+             postos: List[int],
+             arquivo: Path,
+             nome: str,
+             diretorio_saida: Optional[Path],
+             perfil: bool = False,
+             ) -> Tuple[List[Tuple[str, int, str]], Optional[dict], TelemetriaBusca]:
+    """
+    Ajuste conjunto dos postos de um arquivo, executado nos processos do lote.
+
+    Returns
+    -------
+    tuple
+        Nome do arquivo (ver `nome_relativo`), posto e 'ano-mes' do período
+        escolhido, para cada posto, os tempos das etapas da tarefa (None se a medição estiver
+        desligada) e a telemetria da busca dos postos.
+
+    """
+    from amp.script import ModeloMultiPosto
+
+    # Os tempos de cada tarefa são enviados ao processo principal
+    if perfil:
+        PERFIL.ativar()
+    PERFIL.limpar()
+
+    shm = shared_memory.SharedMemory(name=descricao['nome'])
+    try:
+        valores = np.ndarray(descricao['formato'],
+                             dtype=descricao['dtype'],
+                             buffer=shm.buf)
+        df_period = pd.DataFrame(valores,
+                                 index=_periodos_de_ordinais(descricao['periodos']),
+                                 columns=pd.Index(descricao['postos'], name='posto'),
+                                 copy=False)
+
+        # Correlações, ranking e teste da amplitude calculados uma única vez
+        # para todos os postos
+        model = ModeloMultiPosto(postos, posicao=1)
+        model.fit(df_period, descricao['indice_razao'])
+        resultados = [(nome, posto, mes_final_periodo)
+                      for posto, mes_final_periodo in model.mes_final_periodo_.items()]
+        telemetria = TelemetriaBusca()
+        for modelo_posto in model.modelos_.values():
+            telemetria.registrar(modelo_posto.motivos_)
+
+        if diretorio_saida is not None:
+            # Junção do período do arquivo com o período previsto de cada
+            # posto, sem copiar o histórico, que é formatado uma única vez
+            previsoes = model.predict()
+            cenarios = CenariosVazoes.from_dfs(VazoesTxt.from_df_period(df_period),
+                                               [previsoes[posto] for posto in postos])
+            # As subpastas da entrada são reproduzidas na saída
+            destino = diretorio_saida / Path(nome).parent
+            destino.mkdir(parents=True, exist_ok=True)
+            cenarios.salvar_todos([destino / f"{arquivo.stem}_{posto}{arquivo.suffix}"
+                                   for posto in postos])
+            del previsoes, cenarios
+
+        # Nenhuma referência ao bloco pode sobrar antes de fechá-lo
+        del model, df_period, valores
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            # Em caso de erro o traceback ainda referencia os dados; o bloco
+            # é fechado quando essas referências forem coletadas
+            pass
+
+    return resultados, PERFIL.exportar() if PERFIL.ativo else None, telemetria
+
+
+def fluxo_lote(arquivos: Iterable[Union[str, Path]],
+               postos: Optional[List[int]] = None,
+               diretorio_saida: Optional[Union[str, Path]] = None,
+               processos: Optional[int] = None,
+               em_andamento: Optional[int] = None,
+               perfil: bool = False,
+               telemetria: Optional[TelemetriaBusca] = None,
+               diretorio_base: Optional[Union[str, Path]] = None,
+               usar_cache: bool = False,
+               ) -> Iterator[Tuple[str, int, str]]:
+    """
+    Ajusta os modelos dos arquivos em paralelo, à medida que são consumidos.
+
+    Um arquivo só é lido quando há vaga entre as tarefas em andamento, e os
+    seus dados são liberados assim que a tarefa termina. Os arquivos podem
+    vir de um gerador (por exemplo, `listar_arquivos`), que é percorrido
+    sob demanda.
+
+    Parameters
+    ----------
+    arquivos : iterable of str or Path
+        Arquivos de vazões.
+    postos : list of int, optional
+        Postos de referência. O default são os POSTOS_PRINCIPAIS.
+    diretorio_saida : str or Path, optional
+        Se informado, salva um arquivo de vazões com a previsão extendida
+        para cada arquivo e posto.
+    processos : int, optional
+        Quantidade de processos. O default é a quantidade de núcleos.
+    em_andamento : int, optional
+        Quantidade máxima de arquivos lidos e ainda não concluídos. O
+        default é o dobro da quantidade de processos.
+    perfil : bool, optional
+        Se True, mede o tempo das etapas em todos os processos, acumulando
+        em `perfil.PERFIL`. O default é False (ou a variável VAVA_PERFIL).
+    telemetria : TelemetriaBusca, optional
+        Se informada, recebe a busca de candidatos de cada arquivo e posto.
+    diretorio_base : str or Path, optional
+        Diretório de entrada. Se informado, os arquivos são identificados
+        pelo caminho relativo a ele, e as subpastas são reproduzidas no
+        diretório de saída.
+    usar_cache : bool, optional
+        Se True, usa (e cria) o cache binário ao lado de cada arquivo
+        (ver `VazoesTxt`). O default é False.
+
+    Yields
+    ------
+    tuple
+        Nome do arquivo (ver `nome_relativo`), posto e 'ano-mes' do período escolhido, na ordem
+        em que as tarefas terminam.
+
+    """
+    postos = list(postos or POSTOS_PRINCIPAIS)
+    processos = processos or os.cpu_count()
+    em_andamento = em_andamento or 2 * processos
+    if perfil:
+        PERFIL.ativar()
+    if diretorio_saida is not None:
+        diretorio_saida = Path(diretorio_saida)
+        diretorio_saida.mkdir(parents=True, exist_ok=True)
+
+    # Dados de cada tarefa em andamento
+    compartilhados: Dict[Future, DadosCompartilhados] = dict()
+
+    def concluir(concluidos: Set[Future]) -> Iterator[Tuple[str, int, str]]:
+        for futuro in concluidos:
+            # Libera os dados do arquivo assim que seus postos terminarem
+            compartilhados.pop(futuro).liberar()
+            resultados_arquivo, tempos, telemetria_arquivo = futuro.result()
+            if tempos:
+                PERFIL.mesclar(tempos)
+            if telemetria is not None:
+                telemetria.mesclar(telemetria_arquivo)
+            yield from resultados_arquivo
+
+    executor = ProcessPoolExecutor(max_workers=processos)
+    try:
+        for arquivo in map(Path, arquivos):
+            # Só lê o próximo arquivo quando houver vaga
+            while len(compartilhados) >= em_andamento:
+                concluidos, _ = wait(list(compartilhados), return_when=FIRST_COMPLETED)
+                yield from concluir(concluidos)
+
+            vazoes = VazoesTxt(arquivo, usar_cache=usar_cache)
+            dados = DadosCompartilhados(vazoes)
+            del vazoes
+
+            # Uma tarefa por arquivo, com todos os postos
+            futuro = executor.submit(_ajustar,
+                                     dados.descricao,
+                                     postos,
+                                     arquivo,
+                                     nome_relativo(arquivo, diretorio_base),
+                                     diretorio_saida,
+                                     perfil or PERFIL.ativo)
+            compartilhados[futuro] = dados
+
+        while compartilhados:
+            concluidos, _ = wait(list(compartilhados), return_when=FIRST_COMPLETED)
+            yield from concluir(concluidos)
+    finally:
+        # Interrompido (erro ou consumo parcial): cancela o que não começou e
+        # espera o restante antes de liberar os dados
+        for futuro in compartilhados:
+            futuro.cancel()
+        executor.shutdown(wait=True)
+        for dados in compartilhados.values():
+            dados.liberar()
+
+
+def executar_lote(arquivos: Iterable[Union[str, Path]],
+                  postos: Optional[List[int]] = None,
+                  diretorio_saida: Optional[Union[str, Path]] = None,
+                  processos: Optional[int] = None,
+                  perfil: bool = False,
+                  telemetria: Optional[TelemetriaBusca] = None,
+                  em_andamento: Optional[int] = None,
+                  diretorio_base: Optional[Union[str, Path]] = None,
+                  usar_cache: bool = False,
+                  ) -> pd.DataFrame:
+    """
+    Ajusta os modelos de todos os arquivos e postos em paralelo.
+
+    Parameters
+    ----------
+    arquivos : iterable of str or Path
+        Arquivos de vazões.
+    postos : list of int, optional
+        Postos de referência. O default são os POSTOS_PRINCIPAIS.
+    diretorio_saida : str or Path, optional
+        Se informado, salva um arquivo de vazões com a previsão extendida
+        para cada arquivo e posto.
+    processos : int, optional
+        Quantidade de processos. O default é a quantidade de núcleos.
+    perfil : bool, optional
+        Se True, mede o tempo das etapas em todos os processos, acumulando
+        em `perfil.PERFIL`. O default é False (ou a variável VAVA_PERFIL).
+    telemetria : TelemetriaBusca, optional
+        Se informada, recebe a busca de candidatos de cada arquivo e posto.
+    em_andamento : int, optional
+        Quantidade máxima de arquivos em andamento (ver `fluxo_lote`).
+    diretorio_base : str or Path, optional
+        Diretório de entrada, para identificar os arquivos pelo caminho
+        relativo (ver `fluxo_lote`).
+    usar_cache : bool, optional
+        Se True, usa o cache binário ao lado de cada arquivo. O default é
+        False.
+
+    Returns
+    -------
+    DataFrame
+        Tabela (postos x arquivos) com o 'ano-mes' do período escolhido.
+        Sem arquivos, a tabela tem apenas os postos, sem colunas.
+
+    Raises
+    ------
+    ValueError
+        Se dois arquivos tiverem o mesmo nome (informar `diretorio_base`
+        quando houver arquivos com o mesmo nome em subpastas diferentes).
+
+    """
+    postos = list(postos or POSTOS_PRINCIPAIS)
+    # Nomes na ordem dos arquivos, para as colunas da tabela
+    nomes: List[str] = list()
+    vistos: Set[str] = set()
+
+    def registrar_nomes() -> Iterator[Path]:
+        for arquivo in map(Path, arquivos):
+            nome = nome_relativo(arquivo, diretorio_base)
+            if nome in vistos:
+                raise ValueError(f"Arquivo repetido no lote: {nome}")
+            vistos.add(nome)
+            nomes.append(nome)
+            yield arquivo
+
+    resultados = {(nome, posto): mes_final_periodo
+                  for nome, posto, mes_final_periodo in fluxo_lote(registrar_nomes(),
+                                                                   postos,
+                                                                   diretorio_saida,
+                                                                   processos,
+                                                                   em_andamento,
+                                                                   perfil,
+                                                                   telemetria,
+                                                                   diretorio_base,
+                                                                   usar_cache)}
+
+    if resultados:
+        df_anos = pd.Series(resultados, dtype=object).unstack(level=0)
+    else:
+        # Lote vazio (nenhum arquivo encontrado): tabela sem colunas
+        df_anos = pd.DataFrame(dtype=object)
+    df_anos = df_anos.reindex(index=postos, columns=nomes)
+    df_anos.index.name = 'postos'
+
+    return df_anos
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Interface de linha de comando."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('diretorio', type=Path,
+                        help="Diretório com os arquivos de vazões")
+    parser.add_argument('--padrao', default='*.txt',
+                        help="Padrão do nome dos arquivos (default: *.txt)")
+    parser.add_argument('--saida', type=Path, default=None,
+                        help="Diretório para os arquivos com a previsão extendida")
+    parser.add_argument('--tabela', type=Path, default=None,
+                        help="Arquivo csv com a tabela postos x arquivos")
+    parser.add_argument('--processos', type=int, default=None,
+                        help="Quantidade de processos (default: núcleos)")
+    parser.add_argument('--em-andamento', type=int, default=None,
+                        help="Máximo de arquivos em andamento (default: 2 x processos)")
+    parser.add_argument('--cache', action='store_true',
+                        help="Usa e cria o cache binário ao lado de cada arquivo")
+    parser.add_argument('--perfil', nargs='?', type=Path, const=True, default=None,
+                        help="Mede o tempo das etapas; opcionalmente salva em ARQ (.json ou .csv)")
+    parser.add_argument('--telemetria', type=Path, default=None,
+                        help="Arquivo csv com os motivos de rejeição por posição do ranking")
+    args = parser.parse_args(argv)
+
+    arquivos = listar_arquivos(args.diretorio, args.padrao)
+    telemetria = TelemetriaBusca() if args.telemetria is not None else None
+    df_anos = executar_lote(arquivos,
+                            diretorio_saida=args.saida,
+                            processos=args.processos,
+                            perfil=args.perfil is not None,
+                            telemetria=telemetria,
+                            em_andamento=args.em_andamento,
+                            diretorio_base=args.diretorio,
+                            usar_cache=args.cache)
+
+    if args.tabela is not None:
+        df_anos.to_csv(args.tabela)
+    print(df_anos.to_string())
+
+    if PERFIL.ativo:
+        print()
+        print(PERFIL.tabela().to_string())
+        if isinstance(args.perfil, Path):
+            PERFIL.salvar(args.perfil)
+
+    if telemetria is not None:
+        telemetria.salvar(args.telemetria)
+        print()
+        print(telemetria.tabela().to_string())
+        print(f"Posição que resolve 99% das buscas: {telemetria.posicao_necessaria(0.99)}")
+
+
+if __name__ == '__main__':
+    main()
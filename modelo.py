@@ -5,7 +5,8 @@ from typing import Optional
 
 import numpy as np
 import pandas as pd
-from modelos import calc_corr_last12
+from cache_correlacao import calc_corr_last12_cache
+from v import df_somente_leitura
 
 
 class ModeloCamila:
@@ -66,9 +67,9 @@ class ModeloCamila:
             O próprio objeto: self.
 
         """
-        self.df_base = df_base.copy()
+        self.df_base = df_somente_leitura(df_base)
         #Realiza o cálculo da correlação
-        self.df_correlacao = calc_corr_last12(df_base)
+        self.df_correlacao = calc_corr_last12_cache(df_base)
         
         #Ranking das correlações dos postos principais
         self._top_corr_principais = list()
@@ -199,11 +200,11 @@ class ModeloCamila:
         # Dados do período escolhido
         df_escolhido = self.df_base.loc[mes_escolhido_ini:].iloc[:num_meses]
 
-        # Ajusta o index para o novo período
-        df_trecho_ajust = df_escolhido.copy()
-        df_trecho_ajust.index = pd.period_range(next_month,
-                                                periods=len(df_trecho_ajust),
-                                                freq='M')
+        # Ajusta o index para o novo período, sem copiar os dados
+        df_trecho_ajust = df_somente_leitura(df_escolhido,
+                                             pd.period_range(next_month,
+                                                             periods=len(df_escolhido),
+                                                             freq='M'))
 
         return df_trecho_ajust
 
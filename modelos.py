@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""Cálculo das correlações dos últimos 12 meses."""
+import copy
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from perfil import bytes_df, medido
+
+# Tamanho da janela de correlação
+NUM_MESES_JANELA = 12
+
+
+def _momentos_janelas(valores: np.ndarray,
+                      fins: np.ndarray,
+                      ) -> np.ndarray:
+    """
+    Soma e soma dos quadrados de cada janela de 12 meses.
+
+    Usa somas acumuladas, de forma que cada janela custa uma subtração.
+
+    Parameters
+    ----------
+    valores : ndarray
+        Vazões (meses x postos), já centralizadas pela média de cada posto.
+    fins : ndarray
+        Posição do último mês de cada janela.
+
+    Returns
+    -------
+    tuple of ndarray
+        Soma e soma dos quadrados (janelas x postos).
+
+    """
+    acum = np.zeros((len(valores) + 1, valores.shape[1]))
+    np.cumsum(valores, axis=0, out=acum[1:])
+    acum_quad = np.zeros_like(acum)
+    np.cumsum(valores * valores, axis=0, out=acum_quad[1:])
+
+    ini = fins + 1 - NUM_MESES_JANELA
+    soma = acum[fins + 1] - acum[ini]
+    soma_quad = acum_quad[fins + 1] - acum_quad[ini]
+    return soma, soma_quad
+
+
+def corr_janelas(valores: np.ndarray,
+                 referencia: np.ndarray,
+                 fins: np.ndarray,
+                 ) -> np.ndarray:
+    """
+    Correlação de Pearson entre a referência e várias janelas de 12 meses.
+
+    Todas as janelas e postos são calculados de uma só vez: as janelas são
+    vistas (sem cópia) do array original e os momentos vêm de somas acumuladas.
+
+    Parameters
+    ----------
+    valores : ndarray
+        Vazões (meses x postos).
+    referencia : ndarray
+        Vazões de referência (12 x postos), em geral os últimos 12 meses.
+    fins : ndarray
+        Posição do último mês de cada janela a ser correlacionada.
+
+    Returns
+    -------
+    ndarray
+        Correlações (janelas x postos). Janelas ou referência constantes
+        resultam em NaN, como no `corr` do pandas.
+
+    """
+    # Layout fixo (C), para que o resultado não dependa da origem dos dados
+    valores = np.ascontiguousarray(valores, dtype=float)
+    referencia = np.ascontiguousarray(referencia, dtype=float)
+    fins = np.asarray(fins, dtype=np.intp)
+
+    # Centralizar reduz o erro numérico das somas acumuladas
+    valores = valores - valores.mean(axis=0)
+    ref_centrada = referencia - referencia.mean(axis=0)
+
+    # Janelas (meses - 11 x postos x 12) sem cópia dos dados
+    janelas = sliding_window_view(valores, NUM_MESES_JANELA, axis=0)
+    # Produto cruzado com a referência centralizada já é a covariância (x 12)
+    cov = np.einsum('wpk,kp->wp', janelas[fins + 1 - NUM_MESES_JANELA], ref_centrada)
+
+    soma, soma_quad = _momentos_janelas(valores, fins)
+    var_janelas = soma_quad - soma * soma / NUM_MESES_JANELA
+    var_ref = (ref_centrada * ref_centrada).sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = cov / np.sqrt(var_janelas * var_ref)
+
+    # Variância nula (ou negativa por arredondamento) não tem correlação
+    escala = soma_quad + 1.0
+    corr[(var_janelas <= 1e-12 * escala) | (var_ref == 0)] = np.nan
+
+    return np.clip(corr, -1.0, 1.0)
+
+
+@medido('calc_corr_last12', num_bytes=bytes_df)
+def calc_corr_last12(df_period: pd.DataFrame) -> pd.DataFrame:
+    """
+    Correlação dos últimos 12 meses com os mesmos 12 meses de outros anos.
+
+    São consideradas todas as janelas de 12 meses do histórico que terminam
+    no mesmo mês do ano que o último mês informado, incluindo a própria
+    janela final (correlação 1).
+
+    Parameters
+    ----------
+    df_period : DataFrame
+        Dados 'periodizados' (ano/mes x posto), com PeriodIndex mensal.
+
+    Returns
+    -------
+    DataFrame
+        Correlações (período final da janela x posto).
+
+    """
+    if len(df_period) < NUM_MESES_JANELA:
+        raise ValueError(f"São necessários ao menos {NUM_MESES_JANELA} meses")
+
+    valores = df_period.to_numpy(dtype=float)
+    meses = df_period.index.month.to_numpy()
+
+    # Janelas que terminam no mesmo mês do último mês informado
+    fins = np.arange(NUM_MESES_JANELA - 1, len(valores))
+    fins = fins[meses[fins] == meses[-1]]
+
+    corr = corr_janelas(valores, valores[-NUM_MESES_JANELA:], fins)
+
+    df_corr = pd.DataFrame(corr,
+                           index=df_period.index[fins],
+                           columns=df_period.columns)
+    df_corr.index.name = df_period.index.name
+
+    return df_corr
+
+
+class CorrelacaoIncremental:
+    """
+    Estado para atualizar `calc_corr_last12` ao acrescentar meses.
+
+    Guarda as somas acumuladas (e dos quadrados) das vazões e, para cada
+    defasagem d, o produto cruzado entre a janela dos últimos 12 meses e a
+    janela que termina d meses antes. Acrescentar k meses custa O(k x janelas)
+    em vez do recálculo completo.
+
+    Com vazões inteiras todas as somas são feitas em int64, de forma exata,
+    e não acumulam erro com as atualizações.
+
+    Attributes
+    ----------
+    index : PeriodIndex
+        Períodos já incluídos no estado.
+    columns : Index
+        Postos.
+
+    """
+
+    def __init__(self, df_period: pd.DataFrame):
+        """
+        Criação do estado a partir do histórico completo.
+
+        Parameters
+        ----------
+        df_period : DataFrame
+            Dados 'periodizados' (ano/mes x posto), com PeriodIndex mensal.
+
+        """
+        if len(df_period) < NUM_MESES_JANELA:
+            raise ValueError(f"São necessários ao menos {NUM_MESES_JANELA} meses")
+
+        valores = df_period.to_numpy()
+        dtype = np.int64 if valores.dtype.kind in 'iub' else float
+        self._valores = valores.astype(dtype)
+        self.index = df_period.index
+        self.columns = df_period.columns
+
+        self._soma = np.zeros((len(valores) + 1, valores.shape[1]), dtype=dtype)
+        np.cumsum(self._valores, axis=0, out=self._soma[1:])
+        self._soma_quad = np.zeros_like(self._soma)
+        np.cumsum(self._valores * self._valores, axis=0, out=self._soma_quad[1:])
+
+        # Produto cruzado (defasagem x posto) com a janela dos últimos 12 meses
+        n = len(valores)
+        self._cruzado = np.zeros((n - NUM_MESES_JANELA + 1, valores.shape[1]), dtype=dtype)
+        for j in range(NUM_MESES_JANELA):
+            mes_ref = n - NUM_MESES_JANELA + j
+            # Para a defasagem d, o mês da outra janela é mes_ref - d
+            self._cruzado += self._valores[mes_ref::-1][:len(self._cruzado)] * self._valores[mes_ref]
+
+    def copy(self) -> 'CorrelacaoIncremental':
+        """Cópia independente do estado."""
+        # Os arrays nunca são alterados no local, apenas substituídos
+        return copy.copy(self)
+
+    def adicionar(self, df_new_months: pd.DataFrame) -> 'CorrelacaoIncremental':
+        """
+        Acrescenta meses ao estado (no local).
+
+        Parameters
+        ----------
+        df_new_months : DataFrame
+            Novos meses, com o index já ajustado para continuar o histórico.
+
+        Returns
+        -------
+        CorrelacaoIncremental
+            O próprio objeto: self.
+
+        """
+        novos = df_new_months[self.columns].to_numpy().astype(self._valores.dtype)
+        if len(novos) == 0:
+            return self
+
+        self._valores = np.concatenate([self._valores, novos])
+        self._soma = np.concatenate([self._soma,
+                                     self._soma[-1] + np.cumsum(novos, axis=0)])
+        self._soma_quad = np.concatenate([self._soma_quad,
+                                          self._soma_quad[-1] + np.cumsum(novos * novos, axis=0)])
+        self.index = self.index.append(df_new_months.index)
+
+        for ultimo in range(len(self._valores) - len(novos), len(self._valores)):
+            self._avancar(ultimo)
+
+        return self
+
+    def _avancar(self, ultimo: int) -> None:
+        """Desloca a janela de referência para terminar no mês `ultimo`."""
+        x = self._valores
+        saida = ultimo - NUM_MESES_JANELA
+        num_defasagens = len(self._cruzado)
+
+        # Cada defasagem perde o produto do mês que sai e ganha o do mês que entra
+        cruzado = (self._cruzado
+                   - x[saida::-1][:num_defasagens] * x[saida]
+                   + x[ultimo::-1][:num_defasagens] * x[ultimo])
+
+        # Nova defasagem: janela que começa no primeiro mês do histórico
+        nova = (x[:NUM_MESES_JANELA] * x[saida + 1:ultimo + 1]).sum(axis=0)
+        self._cruzado = np.concatenate([cruzado, nova[np.newaxis]])
+
+    def tabela(self) -> pd.DataFrame:
+        """
+        Tabela de correlações para o histórico atual.
+
+        Returns
+        -------
+        DataFrame
+            Mesmo resultado de `calc_corr_last12` para o histórico atual.
+
+        """
+        n = len(self._valores)
+        # Janelas que terminam no mesmo mês do último, em ordem cronológica
+        defasagens = np.arange(0, n - NUM_MESES_JANELA + 1, 12)[::-1]
+        fins = n - 1 - defasagens
+
+        soma = self._soma[fins + 1] - self._soma[fins + 1 - NUM_MESES_JANELA]
+        soma_quad = self._soma_quad[fins + 1] - self._soma_quad[fins + 1 - NUM_MESES_JANELA]
+        soma_ref, soma_quad_ref = soma[-1], soma_quad[-1]
+
+        # Numeradores multiplicados por 12, exatos com valores inteiros
+        cov = NUM_MESES_JANELA * self._cruzado[defasagens] - soma * soma_ref
+        var = NUM_MESES_JANELA * soma_quad - soma * soma
+        var_ref = NUM_MESES_JANELA * soma_quad_ref - soma_ref * soma_ref
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / np.sqrt(var.astype(float) * var_ref.astype(float))
+        corr[(var <= 0) | (var_ref <= 0)] = np.nan
+
+        df_corr = pd.DataFrame(np.clip(corr, -1.0, 1.0),
+                               index=self.index[fins],
+                               columns=self.columns)
+        df_corr.index.name = self.index.name
+
+        return df_corr
+
+
+class RankingCorrelacao:
+    """
+    Maiores correlações de vários postos, calculadas sob demanda.
+
+    Equivale a `df_corr[coluna].sort_values(ascending=False)` para cada
+    coluna, mas apenas as K primeiras posições são ordenadas, para todas as
+    colunas de uma só vez (`np.argpartition`). Se forem pedidas posições além
+    de K, o ranking é estendido. Empates ficam na ordem cronológica e as
+    correlações NaN ficam no final.
+
+    Attributes
+    ----------
+    df_corr : DataFrame
+        Correlações (período final da janela x posto).
+    colunas : list
+        Postos do ranking.
+
+    """
+
+    def __init__(self,
+                 df_corr: pd.DataFrame,
+                 colunas: list,
+                 k: int = 11):
+        """
+        Criação do ranking.
+
+        Parameters
+        ----------
+        df_corr : DataFrame
+            Correlações, como em `calc_corr_last12`.
+        colunas : list
+            Postos do ranking.
+        k : int, optional
+            Quantidade de posições calculadas inicialmente. O default é 11
+            (o próprio período final e os dez seguintes).
+
+        """
+        self.df_corr = df_corr
+        self.colunas = list(colunas)
+        self._posicao_coluna = {coluna: j for j, coluna in enumerate(self.colunas)}
+
+        # Chave de ordenação crescente: maior correlação primeiro, NaN no final
+        valores = df_corr[self.colunas].to_numpy(dtype=float)
+        self._valores = valores
+        self._chave = np.where(np.isnan(valores), np.inf, -valores)
+        # Posições (ranking x coluna) das janelas já ordenadas
+        self._ordem = np.empty((0, len(self.colunas)), dtype=np.intp)
+        self._estender(k)
+
+    def __len__(self) -> int:
+        return len(self._chave)
+
+    @medido('ranking')
+    def _estender(self, k: int) -> None:
+        """Ordena as k primeiras posições de todas as colunas."""
+        n = len(self._chave)
+        k = min(k, n)
+        if k <= len(self._ordem):
+            return
+
+        if k < n:
+            # Limiar da k-ésima posição, sem ordenar as demais janelas
+            particao = np.argpartition(self._chave, k - 1, axis=0)
+            limiar = np.take_along_axis(self._chave, particao[k - 1:k], axis=0)
+            menores = self._chave < limiar
+            # Empates no limiar completam as k posições em ordem cronológica
+            iguais = self._chave == limiar
+            faltam = k - menores.sum(axis=0)
+            selecao = menores | (iguais & (np.cumsum(iguais, axis=0) <= faltam))
+            # Posições selecionadas de cada coluna, em ordem cronológica
+            posicoes = np.nonzero(selecao.T)[1].reshape(len(self.colunas), k).T
+        else:
+            posicoes = np.broadcast_to(np.arange(n)[:, np.newaxis], self._chave.shape)
+
+        # Ordena apenas as selecionadas; o desempate é a posição cronológica
+        chave = np.take_along_axis(self._chave, posicoes, axis=0)
+        ordem = np.lexsort((posicoes.T, chave.T)).T
+        self._ordem = np.take_along_axis(posicoes, ordem, axis=0)
+
+    def posicoes(self, coluna, inicio: int, fim: int) -> np.ndarray:
+        """
+        Posições em df_corr das janelas de `inicio` a `fim - 1` no ranking.
+
+        Parameters
+        ----------
+        coluna : int
+            Posto do ranking.
+        inicio : int
+            Primeira posição do ranking (0 é a maior correlação).
+        fim : int
+            Posição final do ranking (não incluída).
+
+        Returns
+        -------
+        ndarray
+            Posições das janelas, como em `sort_values(...).iloc[inicio:fim]`.
+
+        """
+        if fim > len(self._ordem):
+            # Dobra o tamanho para que extensões sucessivas sejam raras
+            self._estender(max(fim, 2 * len(self._ordem)))
+        return self._ordem[inicio:fim, self._posicao_coluna[coluna]]
+
+    def periodos(self, coluna, inicio: int, fim: int) -> pd.PeriodIndex:
+        """Períodos das posições `inicio` a `fim - 1` do ranking da coluna."""
+        return self.df_corr.index[self.posicoes(coluna, inicio, fim)]
+
+    def correlacoes(self, coluna, inicio: int, fim: int) -> np.ndarray:
+        """Correlações das posições `inicio` a `fim - 1` do ranking da coluna."""
+        return self._valores[self.posicoes(coluna, inicio, fim), self._posicao_coluna[coluna]]
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Medição do tempo de cada etapa do processamento.
+
+As etapas são marcadas com `with etapa('nome'):` ou, para funções inteiras,
+com o decorador `@medido('nome')`. Com a medição desligada (default), o
+custo é de uma chamada de função. A medição é ligada pela variável de
+ambiente VAVA_PERFIL (qualquer valor diferente de '', '0' ou 'false') ou por
+`PERFIL.ativar()`.
+
+Exemplo:
+    PERFIL.ativar()
+    ...
+    print(PERFIL.tabela().to_string())
+    PERFIL.salvar('perfil.json')
+"""
+import functools
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+import pandas as pd
+
+# Variável de ambiente que liga a medição
+VAR_AMBIENTE_PERFIL = 'VAVA_PERFIL'
+
+
+class _EtapaNula:
+    """Etapa usada com a medição desligada: não registra nada."""
+
+    num_bytes = 0
+
+    def __enter__(self) -> '_EtapaNula':
+        return self
+
+    def __exit__(self, *args) -> None:
+        return None
+
+
+_ETAPA_NULA = _EtapaNula()
+
+
+class _Etapa:
+    """Medição de uma execução de uma etapa."""
+
+    __slots__ = ('_registro', '_nome', 'num_bytes', '_inicio')
+
+    def __init__(self, registro: 'RegistroPerfil', nome: str, num_bytes: int):
+        self._registro = registro
+        self._nome = nome
+        # Pode ser alterado dentro do bloco, quando só é conhecido no final
+        self.num_bytes = num_bytes
+        self._inicio = 0.0
+
+    def __enter__(self) -> '_Etapa':
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._registro.registrar(self._nome,
+                                 time.perf_counter() - self._inicio,
+                                 self.num_bytes)
+
+
+class RegistroPerfil:
+    """
+    Registro do tempo, quantidade de chamadas e bytes processados por etapa.
+
+    Etapas aninhadas são medidas de forma independente: o tempo de cada uma
+    inclui o das etapas internas.
+
+    Attributes
+    ----------
+    ativo : bool
+        Se a medição está ligada.
+
+    """
+
+    def __init__(self, ativo: Optional[bool] = None):
+        """
+        Criação do registro.
+
+        Parameters
+        ----------
+        ativo : bool, optional
+            Liga a medição. O default é consultar a variável VAVA_PERFIL.
+
+        """
+        if ativo is None:
+            ativo = os.environ.get(VAR_AMBIENTE_PERFIL, '').lower() not in ('', '0', 'false')
+        self.ativo = ativo
+        # Por etapa: [chamadas, tempo total (s), bytes]
+        self._totais: Dict[str, List[float]] = dict()
+        self._trava = threading.Lock()
+
+    def ativar(self) -> None:
+        """Liga a medição."""
+        self.ativo = True
+
+    def desativar(self) -> None:
+        """Desliga a medição (os totais já registrados são mantidos)."""
+        self.ativo = False
+
+    def limpar(self) -> None:
+        """Apaga os totais registrados."""
+        with self._trava:
+            self._totais.clear()
+
+    def etapa(self, nome: str, num_bytes: int = 0) -> Union[_Etapa, _EtapaNula]:
+        """
+        Contexto que mede uma execução da etapa.
+
+        Parameters
+        ----------
+        nome : str
+            Nome da etapa.
+        num_bytes : int, optional
+            Bytes processados. Pode ser informado depois, no atributo
+            `num_bytes` do objeto retornado pelo `with`.
+
+        """
+        if not self.ativo:
+            return _ETAPA_NULA
+        return _Etapa(self, nome, num_bytes)
+
+    def registrar(self, nome: str, segundos: float, num_bytes: int = 0) -> None:
+        """Acrescenta uma execução da etapa aos totais."""
+        with self._trava:
+            totais = self._totais.setdefault(nome, [0, 0.0, 0])
+            totais[0] += 1
+            totais[1] += segundos
+            totais[2] += int(num_bytes)
+
+    def exportar(self) -> Dict[str, List[float]]:
+        """Totais por etapa ([chamadas, segundos, bytes]), para `mesclar`."""
+        with self._trava:
+            return {nome: list(totais) for nome, totais in self._totais.items()}
+
+    def mesclar(self, totais: Dict[str, List[float]]) -> None:
+        """Soma os totais exportados por outro registro (por exemplo, de outro processo)."""
+        for nome, (chamadas, segundos, num_bytes) in totais.items():
+            with self._trava:
+                atuais = self._totais.setdefault(nome, [0, 0.0, 0])
+                atuais[0] += chamadas
+                atuais[1] += segundos
+                atuais[2] += num_bytes
+
+    def tabela(self) -> pd.DataFrame:
+        """
+        Resumo por etapa, da que consumiu mais tempo para a que consumiu menos.
+
+        Returns
+        -------
+        DataFrame
+            Chamadas, tempo total e médio (s), bytes e vazão (MB/s) por etapa.
+
+        """
+        df = pd.DataFrame.from_dict(self.exportar(), orient='index',
+                                    columns=['chamadas', 'tempo_total', 'bytes'])
+        df.index.name = 'etapa'
+        df['tempo_medio'] = df['tempo_total'] / df['chamadas']
+        df['mb_por_s'] = df['bytes'] / 1e6 / df['tempo_total'].where(df['tempo_total'] > 0)
+        df = df.astype({'chamadas': int, 'bytes': int})
+        return df[['chamadas', 'tempo_total', 'tempo_medio', 'bytes', 'mb_por_s']] \
+            .sort_values('tempo_total', ascending=False)
+
+    def salvar(self, arquivo_destino: Union[str, Path]) -> None:
+        """
+        Salva o resumo em JSON (extensão .json) ou CSV (outras extensões).
+
+        Parameters
+        ----------
+        arquivo_destino : str or Path
+            Nome ou caminho do arquivo de destino.
+
+        """
+        arquivo_destino = Path(arquivo_destino)
+        if arquivo_destino.suffix.lower() == '.json':
+            dados = {nome: {'chamadas': chamadas, 'tempo_total': segundos, 'bytes': num_bytes}
+                     for nome, (chamadas, segundos, num_bytes) in self.exportar().items()}
+            arquivo_destino.write_text(json.dumps(dados, indent=2), encoding='utf-8')
+        else:
+            self.tabela().to_csv(arquivo_destino)
+
+
+# Registro compartilhado pelos módulos
+PERFIL = RegistroPerfil()
+
+
+def etapa(nome: str, num_bytes: int = 0) -> Union[_Etapa, _EtapaNula]:
+    """`PERFIL.etapa`: mede uma execução da etapa no registro compartilhado."""
+    return PERFIL.etapa(nome, num_bytes)
+
+
+def medido(nome: str, num_bytes: Optional[Callable[..., int]] = None) -> Callable:
+    """
+    Decorador que mede cada chamada da função como uma etapa.
+
+    Parameters
+    ----------
+    nome : str
+        Nome da etapa.
+    num_bytes : callable, optional
+        Função que recebe os mesmos argumentos da função decorada e retorna
+        os bytes processados. Só é chamada com a medição ligada.
+
+    """
+    def decorador(funcao: Callable) -> Callable:
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            if not PERFIL.ativo:
+                return funcao(*args, **kwargs)
+            with _Etapa(PERFIL, nome, num_bytes(*args, **kwargs) if num_bytes else 0):
+                return funcao(*args, **kwargs)
+        return medida
+    return decorador
+
+
+def bytes_df(df: pd.DataFrame, *args, **kwargs) -> int:
+    """Bytes dos valores de um dataframe, para o `num_bytes` de `medido`."""
+    return int(df.memory_usage(index=False).sum())
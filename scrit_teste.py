@@ -23,7 +23,6 @@ if (folder := str(folderpath)) not in sys.path:
 
 
 lista_arquivos = list()
-lista_modelos = list()
 anos_usados = list()
 resultados = dict()
 #por enquanto uma lista
@@ -43,16 +42,14 @@ def walk(caminho):
 
 
 # recursively traverse all files from current directory
-# the function returns a generator so if you need a list you need to build one
-all_files = list(walk(caminho))
-lista_vazoes = list()
+# the function returns a generator: os arquivos são encontrados à medida que
+# o loop avança, sem montar a lista completa antes
 anos_usados = list()
 
 
-for arq in all_files:    
-    # Criação do objeto de vazões
-    vazoes = VazoesTxt(arq)
-    lista_vazoes.append(vazoes)
+for arq in walk(caminho):
+    # Criação do objeto de vazões. O arquivo só é lido quando usado
+    vazoes = VazoesTxt(arq, sob_demanda=True)
     #posteriormente modificar os parâmetros na classe Vazões
     lista_arquivos.append(vazoes._filepath.stem)
     
@@ -65,15 +62,18 @@ for arq in all_files:
     # #                    if qtde > 2]
     # # Parametrização do modelo
     
-    for vaz in lista_vazoes:
-        # Criação do modelo.
-        # O modelo criado está bem simplificado, e estamos tentando seguir o exemplo
-        # do scikit-learn, com métodos fit e predict.
-        model = ModeloCamila()
-        model.fit(vaz.df_period)
-        lista_modelos.append(model)
-        anos_usados.append(model.anos_)
-        # Predição para um novo período
-        resultados.append(model.predict())
-        
-        #anos_usados.extend(model.anos_)
+    # Criação do modelo.
+    # O modelo criado está bem simplificado, e estamos tentando seguir o exemplo
+    # do scikit-learn, com métodos fit e predict.
+    model = ModeloCamila()
+    model.fit(vazoes.df_period)
+    anos_usados.append(model.anos_)
+    # Predição para um novo período. A cópia não depende mais do histórico,
+    # que pode ser liberado antes do próximo arquivo
+    resultados.append(model.predict().copy())
+    
+    #anos_usados.extend(model.anos_)
+
+    # Apenas um arquivo fica em memória por vez
+    del model
+    vazoes.liberar()
@@ -1,12 +1,252 @@
 # -*- coding: utf-8 -*-
 """Em desenvolvimento."""
 
-from typing import Optional
+import os
+from typing import Deque, Iterable, Iterator, Optional, Tuple
 
 import numpy as np
 import pandas as pd
-from modelos import calc_corr_last12
-from collections import Counter
+from amplitude import APROVADO, TesteAmplitude, motivos_candidatos
+from cache_correlacao import calc_corr_last12_cache
+from modelos import RankingCorrelacao
+from perfil import medido
+from telemetria import ANO_PROIBIDO, TelemetriaBusca
+from v import CenariosVazoes, VazoesTxt, df_somente_leitura
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+
+#A maior correlação
+FIRST_RANK_CORR = 1
+#número arbitário, mas que seja entre 10 e 25.
+#escolhendo uma correlação alta, mas que passe pelos testes
+POSICAO_LIMITE_RANK_CORR = 20
+
+
+def calcular_candidatos(df_base: pd.DataFrame, postos_principais: dict) -> list:
+    """
+    Ranking das correlações e Teste da Amplitude para os postos principais.
+
+    É a etapa cara do ajuste e não depende dos anos usados em outros
+    arquivos, podendo ser executada em paralelo para vários arquivos.
+
+    Parameters
+    ----------
+    df_base : DataFrame
+        Dados históricos para cálculo das correlações.
+    postos_principais : dict
+        Postos principais, na ordem em que os anos serão escolhidos.
+
+    Returns
+    -------
+    list
+        Para cada posto principal, uma tupla com os períodos candidatos (da
+        posição FIRST_RANK_CORR até POSICAO_LIMITE_RANK_CORR - 1 do ranking),
+        suas correlações e uma matriz (candidatos x postos de df_base) com o
+        resultado do teste da amplitude (`TesteAmplitude.motivos`).
+
+    """
+    #Realiza o cálculo da correlação
+    df_correlacao = calc_corr_last12_cache(df_base)
+
+    #ranking das correlações dos principais postos, todos de uma só vez e
+    #apenas até a posição limite. Todos os candidatos até o limite são
+    #avaliados aqui, porque os anos proibidos só são conhecidos na escolha
+    #(em ordem, fora deste processo): o ranking não precisa ser estendido
+    postos = list(postos_principais.keys())
+    ranking = RankingCorrelacao(df_correlacao, postos, k=POSICAO_LIMITE_RANK_CORR)
+
+    #O teste da amplitude é feito para todos os postos de uma só vez; a
+    #escolha de quais postos devem passar fica para escolher_anos
+    teste = TesteAmplitude(df_base)
+    candidatos = list()
+    for posto in postos:
+        periodos = ranking.periodos(posto, FIRST_RANK_CORR, POSICAO_LIMITE_RANK_CORR)
+        candidatos.append((periodos,
+                           ranking.correlacoes(posto, FIRST_RANK_CORR, POSICAO_LIMITE_RANK_CORR),
+                           teste.motivos(periodos).to_numpy()))
+
+    return candidatos
+
+
+def _calcular_candidatos_arquivo(df_base: pd.DataFrame) -> Tuple[pd.DataFrame, list]:
+    """
+    Primeira etapa do ajuste de um arquivo, executada nos processos.
+
+    Retorna também as correlações (calculadas uma única vez, pelo cache),
+    para que o modelo fique no mesmo estado do fit.
+
+    """
+    df_correlacao = calc_corr_last12_cache(df_base)
+    return df_correlacao, calcular_candidatos(df_base, ModeloCamila().postos_principais)
+
+
+def fluxo_modelos(lista_df_base: Iterable[pd.DataFrame],
+                  processos: Optional[int] = None,
+                  em_andamento: Optional[int] = None,
+                  postos_amplitude: Optional[list] = None,
+                  telemetria: Optional[TelemetriaBusca] = None,
+                  ) -> Iterator['ModeloCamila']:
+    """
+    Ajuste dos modelos de vários arquivos, à medida que são consumidos.
+
+    Mesmo resultado de `ajustar_modelos`, mas os dados são lidos do iterável
+    apenas quando há vaga entre os arquivos em andamento, e cada modelo é
+    retornado, na ordem dos arquivos, assim que os anteriores terminarem.
+    Se o chamador não guardar os modelos, a memória usada não depende da
+    quantidade de arquivos.
+
+    Parameters
+    ----------
+    lista_df_base : iterable of DataFrame
+        Dados históricos de cada arquivo, na ordem de escolha dos anos. Pode
+        ser um gerador, que é percorrido sob demanda.
+    processos : int, optional
+        Quantidade de processos. O default é a quantidade de núcleos.
+    em_andamento : int, optional
+        Quantidade máxima de arquivos lidos e ainda não retornados. O default
+        é o dobro da quantidade de processos.
+    postos_amplitude : list, optional
+        Postos que devem passar no teste da amplitude. O default é apenas o
+        último posto principal, como no fit.
+    telemetria : TelemetriaBusca, optional
+        Se informada, recebe a busca de cada posto principal de cada arquivo.
+
+    Yields
+    ------
+    ModeloCamila
+        Modelos ajustados, na mesma ordem dos arquivos.
+
+    """
+    processos = processos or os.cpu_count()
+    em_andamento = em_andamento or 2 * processos
+    anos_usados = list()
+
+    def escolher(df_base: pd.DataFrame, futuro: Future) -> 'ModeloCamila':
+        # A escolha dos anos depende dos arquivos anteriores: é feita em ordem
+        df_correlacao, candidatos = futuro.result()
+        model = ModeloCamila()
+        model.postos_amplitude = postos_amplitude
+        model.df_base = df_somente_leitura(df_base)
+        model.df_correlacao = df_correlacao
+        model._candidatos_ = candidatos
+        model.escolher_anos(anos_proibidos=anos_usados)
+        anos_usados.append(model.anos_)
+        if telemetria is not None:
+            for motivos in model.motivos_.values():
+                telemetria.registrar(motivos, FIRST_RANK_CORR)
+        return model
+
+    # Arquivos em andamento, na ordem de entrada
+    pendentes: Deque[Tuple[pd.DataFrame, Future]] = deque()
+    executor = ProcessPoolExecutor(max_workers=processos)
+    try:
+        for df_base in lista_df_base:
+            if len(pendentes) >= em_andamento:
+                yield escolher(*pendentes.popleft())
+            pendentes.append((df_base, executor.submit(_calcular_candidatos_arquivo, df_base)))
+
+        while pendentes:
+            yield escolher(*pendentes.popleft())
+    finally:
+        # Interrompido: cancela o que ainda não começou
+        for _, futuro in pendentes:
+            futuro.cancel()
+        executor.shutdown(wait=True)
+
+
+def ajustar_modelos(lista_df_base: list,
+                    processos: Optional[int] = None,
+                    postos_amplitude: Optional[list] = None,
+                    telemetria: Optional[TelemetriaBusca] = None,
+                    ) -> list:
+    """
+    Ajuste dos modelos de vários arquivos, sem repetir os anos escolhidos.
+
+    Equivale a ajustar os arquivos em sequência, passando para cada um os
+    anos escolhidos nos anteriores. As correlações e os testes da amplitude
+    de todos os arquivos são calculados em paralelo, e apenas a escolha dos
+    anos, que é barata, é feita em sequência. Para lotes grandes, ver
+    `fluxo_modelos`.
+
+    Parameters
+    ----------
+    lista_df_base : list of DataFrame
+        Dados históricos de cada arquivo, na ordem de escolha dos anos.
+    processos : int, optional
+        Quantidade de processos. O default é a quantidade de núcleos.
+    postos_amplitude : list, optional
+        Postos que devem passar no teste da amplitude. O default é apenas o
+        último posto principal, como no fit.
+    telemetria : TelemetriaBusca, optional
+        Se informada, recebe a busca de cada posto principal de cada arquivo.
+
+    Returns
+    -------
+    list of ModeloCamila
+        Modelos ajustados, na mesma ordem dos arquivos.
+
+    """
+    # Todos os arquivos já estão em memória: nenhum limite de andamento
+    return list(fluxo_modelos(lista_df_base,
+                              processos,
+                              em_andamento=max(len(lista_df_base), 1),
+                              postos_amplitude=postos_amplitude,
+                              telemetria=telemetria))
+
+
+class CenariosPrevisao:
+    """
+    Previsões de todos os anos escolhidos em um único array.
+
+    Cada cenário é o trecho do histórico que começa no mês seguinte ao último
+    mês da base, no ano escolhido, reposicionado após o final da base.
+
+    Attributes
+    ----------
+    valores : ndarray
+        Vazões previstas (cenários x meses x postos).
+    index : PeriodIndex
+        Meses previstos, comuns a todos os cenários.
+    columns : Index
+        Postos.
+    anos : list
+        Ano escolhido de cada cenário.
+
+    """
+
+    def __init__(self,
+                 valores: np.ndarray,
+                 index: pd.PeriodIndex,
+                 columns: pd.Index,
+                 anos: list):
+        self.valores = valores
+        self.index = index
+        self.columns = columns
+        self.anos = anos
+
+    def __len__(self) -> int:
+        return len(self.valores)
+
+    def df_cenario(self, i: int) -> pd.DataFrame:
+        """
+        Dataframe (sem cópia) com a previsão de um cenário.
+
+        Parameters
+        ----------
+        i : int
+            Posição do cenário.
+
+        Returns
+        -------
+        DataFrame
+            Previsão (ano/mes x posto) do cenário.
+
+        """
+        return pd.DataFrame(self.valores[i],
+                            index=self.index,
+                            columns=self.columns,
+                            copy=False)
 
 
 class ModeloCamila:
@@ -35,6 +275,10 @@ class ModeloCamila:
             
         
         self.posicao = 1
+
+        #postos que devem passar no teste da amplitude, por exemplo os de um
+        #subsistema. Se None, apenas o último posto principal
+        self.postos_amplitude = None
         
         # Atributos que serão definidos apenas ao realizar o fit
         self.df_base = None
@@ -45,7 +289,12 @@ class ModeloCamila:
         self.mes_final_periodo_ = None
         self.anos_ = list()
         self.df_previsao_extendida = list()
+        self._candidatos_ = None
+        #motivo de cada candidato percorrido, por posto principal
+        #(ver telemetria.MOTIVOS)
+        self.motivos_ = dict()
 
+    @medido('fit')
     def fit(self, df_base: pd.DataFrame,
             anos_proibidos:list) -> 'ModeloCamila':
         """
@@ -53,117 +302,86 @@ class ModeloCamila:
 
         O teste consiste em verificar se a relação da previsão está em intervalo
         entre o valor máximo e o mínimo da relação das vazôes do histórico.
+
+        O ajuste é feito em duas etapas: `calcular_candidatos`, que concentra
+        todo o custo e não depende dos outros arquivos, e `escolher_anos`,
+        que apenas evita a repetição dos anos já usados.
         
         
         Parameters
         ----------
         df_base : DataFrame
             Dados históricos para cálculo das correlações.
+        anos_proibidos : list
+            Lista com os anos escolhidos para cada arquivo anterior.
             
         Return
         ----------
             O próprio objeto: self.
 
         """
-        self.df_base = df_base.copy()
+        self.df_base = df_somente_leitura(df_base)
         #Realiza o cálculo da correlação
-        self.df_correlacao = calc_corr_last12(df_base)
-        
-        #Ranking das correlações dos postos principais
-        self._ranking_corr_principais = list()
-        
-        #lista com ranking das correlações dos principais postos
-        for coluna in self.postos_principais.keys():
-            ranking_corr = self.df_correlacao[coluna].sort_values(ascending=False)
-            self._ranking_corr_principais.append(ranking_corr)    
-            
-        
+        self.df_correlacao = calc_corr_last12_cache(df_base)
+        self._candidatos_ = calcular_candidatos(self.df_base, self.postos_principais)
+        return self.escolher_anos(anos_proibidos)
+
+
+    def escolher_anos(self, anos_proibidos: list) -> 'ModeloCamila':
+        """
+        Escolha dos anos a partir dos candidatos já calculados.
+
+        Para cada posto principal é escolhido o ano mais bem colocado no
+        ranking que passou no teste da amplitude e que não foi usado nos
+        arquivos anteriores.
+
+        Parameters
+        ----------
+        anos_proibidos : list
+            Lista com os anos escolhidos para cada arquivo anterior.
+
+        Return
+        ----------
+            O próprio objeto: self.
+
+        """
         #Armazena a informação dos anos dos arquivos
         #Counter é um contêiner que armazena elementos e suas contagens em dict
         _counter_ = Counter()
         for anos in anos_proibidos:
             _counter_.update(anos)
-        
 
-        #A maior correlação
-        FIRST_RANK_CORR = 1
-        #número arbitário, mas que seja entre 10 e 25.
-        #escolhendo uma correlação alta, mas que passe pelos testes
-        POSICAO_LIMITE_RANK_CORR = 20
-        
-        
-        
-        for corr_postos in self._ranking_corr_principais:
-            
-            for posicao_atual in range(FIRST_RANK_CORR, POSICAO_LIMITE_RANK_CORR):      
-                
-                #TESTE DA AMPLITUDE INICIA AQUI
-                # Dados que serão usados para previsão
-                self._period_ = corr_postos.index[posicao_atual]
-                #Para selecionar o primeiro mês da previsão extendida
-                mes_escolhido_ini = self._period_ + 1       
-                #série com os dados do primeiro mês da previsão extendida
-                series_proximo_mes = self.df_base.loc[mes_escolhido_ini]
-                
-                #Renomeando index para ano e mes da previsão extendida
-                series_proximo_mes.name = self.df_base.index[-1] + 1
-                
-                
-                #Acrescentando o primeiro mês da previsão extendida nos dados originais
-                df_base_modif = pd.concat([self.df_base, series_proximo_mes.to_frame().T])
-                
-                #Cálculo da razão
-                #Dividindo a vazão dos meses pelo seu mês posterior
-                df_razao = df_base_modif.shift(1) / df_base_modif
-                #substitui os valores NaN e infinito por zero
-                df_razao.replace([np.inf, np.nan], 0, inplace=True)
-                #Identifica o mês para aplicar o teste da amplitude e retorna para todos os anos
-                #O mês selecionado é o que inicia a previsão
-                df_razao = df_razao[df_razao.index.month == mes_escolhido_ini.month]
-                #Razão da vazao da previsaõ da Refinitiv pelo primeiro mês da vazão extendida
-                df_razao_previsao = df_razao.iloc[-1, :]
-                #Valor máximo do histórico, excluindo a previsão da Refinitiv
-                df_razao_maximo = df_razao.iloc[:-1, :].max()
-                #Valor da razão mínima do histórico
-                df_razao_minima = df_razao.iloc[:-1, :].min()
-            
-                
-                #Variáveis que guardam quais foram as usinas que não passaram no teste
-                teste_amplitude_max = df_razao_previsao[df_razao_previsao >= df_razao_maximo]
-                teste_amplitude_min = df_razao_previsao[df_razao_previsao <= df_razao_minima]
-                
-                #Verifica se a usina de referência consta nas variáveis das usinas que falharam
-                teste_da_amplitude = (ranking_corr.name in teste_amplitude_max.index.to_list() or
-                                      ranking_corr.name in teste_amplitude_min.index.to_list())
-                
-                
-                
-                
+        #Como no laço original, por default o teste da amplitude verifica a
+        #usina do último posto principal
+        postos_amplitude = self.postos_amplitude or list(self.postos_principais)[-1:]
+        idx_colunas = self.df_base.columns.get_indexer(postos_amplitude)
+
+        self.motivos_ = dict()
+        for posto, (periodos, correlacoes, motivos_postos) in zip(self.postos_principais,
+                                                                   self._candidatos_):
+            motivos = motivos_candidatos(motivos_postos, idx_colunas)
+            for i, (periodo, correlacao) in enumerate(zip(periodos, correlacoes)):
+                self._period_ = periodo
+                self.motivos_[posto] = motivos[:i + 1]
+
                 #anos que passaram no teste da amplitude
-                if teste_da_amplitude is False:
-                    
-                    #TESTE QUE EVITA REPETIÇÃO DOS ANOS
-                    #verifica se o ano foi usado anterior no mesmo arquivo ou nos outros arquivos
-                    #se sim, utiliza o próximo ano do ranking
-                    if self._period_.year in _counter_.keys():
-                        continue
-                    
-                    
-                    else:
-                        #caso o ano não tenha sido usado
-                        self.posicao = posicao_atual
-                        
-                        # Outras informações sobre o modelo 'treinado'
-                        # Usando sufixo _ semelhante ao scikit-learn
-                        self.anos_.append(self._period_.year)
-                        self.correlacao_.append(corr_postos.iloc[self.posicao])
-                        
-                        """verificar se realmente há necessidade dessa informação"""
-                        #self.correlacao_outros_.append(self.df_correlacao.loc[corr_postos.index[self.posicao]])
-                        break
-                    
-                    
-           
+                if motivos[i] != APROVADO:
+                    continue
+
+                #TESTE QUE EVITA REPETIÇÃO DOS ANOS
+                #verifica se o ano foi usado anterior no mesmo arquivo ou nos outros arquivos
+                #se sim, utiliza o próximo ano do ranking
+                if self._period_.year in _counter_.keys():
+                    motivos[i] = ANO_PROIBIDO
+                    continue
+
+                #caso o ano não tenha sido usado
+                # Outras informações sobre o modelo 'treinado'
+                # Usando sufixo _ semelhante ao scikit-learn
+                self.anos_.append(self._period_.year)
+                self.correlacao_.append(correlacao)
+                break
+
         """modificar aqui.
             porque pega apenas o último ano do último arquivo.
         """
@@ -173,6 +391,29 @@ class ModeloCamila:
         return self
 
 
+    def falhas_amplitude(self) -> pd.DataFrame:
+        """
+        Quantidade de postos que falharam no teste da amplitude.
+
+        Returns
+        -------
+        DataFrame
+            Para cada posto principal (linhas) e posição no ranking (colunas,
+            a partir de FIRST_RANK_CORR), a quantidade de postos reprovados.
+
+        """
+        if self._candidatos_ is None:
+            raise Exception("Realizar o fit do modelo antes")
+
+        falhas = [(motivos_postos != APROVADO).sum(axis=1)
+                  for _, _, motivos_postos in self._candidatos_]
+        return pd.DataFrame(falhas,
+                            index=pd.Index(list(self.postos_principais), name='posto'),
+                            columns=pd.RangeIndex(FIRST_RANK_CORR,
+                                                  FIRST_RANK_CORR + max(map(len, falhas), default=0),
+                                                  name='posicao'))
+
+    @medido('predict')
     def predict(self,
                 num_meses: Optional[int] = None,
                 ) -> pd.DataFrame:
@@ -221,18 +462,97 @@ class ModeloCamila:
             # Dados do período escolhido
             df_escolhido = self.df_base.loc[mes_escolhido_ini:].iloc[:num_meses]
 
-            # Ajusta o index para o novo período
-            df_trecho_ajust = df_escolhido.copy()
-            df_trecho_ajust.index = pd.period_range(next_month,
-                                                    periods=len(df_trecho_ajust),
-                                                    freq='M')
+            # Ajusta o index para o novo período, sem copiar os dados
+            df_trecho_ajust = df_somente_leitura(df_escolhido,
+                                                 pd.period_range(next_month,
+                                                                 periods=len(df_escolhido),
+                                                                 freq='M'))
             
             
             self.list_trecho_escolhido.append(df_trecho_ajust)
             
         return self.list_trecho_escolhido
 
-    
+
+    @medido('predict_lote')
+    def predict_lote(self,
+                     num_meses: Optional[int] = None,
+                     ) -> CenariosPrevisao:
+        """
+        Previsão de todos os anos escolhidos de uma só vez.
+
+        Os trechos são obtidos por indexação do array da base, sem criar um
+        dataframe por cenário. Se algum ano escolhido não tiver `num_meses`
+        meses no histórico, todos os cenários ficam com o tamanho do menor.
+
+        Parameters
+        ----------
+        num_meses : int, optional
+            Número de meses a serem previstos.
+            Se não informado será feita a previsão até final do último ano informado.
+
+        Returns
+        -------
+        CenariosPrevisao
+            Previsões (cenários x meses x postos) e seus índices.
+
+        """
+        if self.df_base is None:
+            raise Exception("Realizar o fit do modelo antes")
+
+        # Primeiro mês a ser previsto
+        next_month = self.df_base.index[-1] + 1
+        num_meses = num_meses if num_meses else (13 - next_month.month)
+
+        # Posição do mês seguinte ao período selecionado, em cada ano escolhido
+        ordinais = self.df_base.index.asi8
+        inicios = np.array([pd.Period(year=anos, month=next_month.month, freq='M').ordinal
+                            for anos in self.anos_], dtype=np.int64)
+        posicoes = np.searchsorted(ordinais, inicios)
+        if len(posicoes):
+            num_meses = max(min(num_meses, len(ordinais) - posicoes.max()), 0)
+
+        # (cenários x meses) posições na base
+        linhas = posicoes[:, np.newaxis] + np.arange(num_meses)
+        valores = self.df_base.to_numpy()[linhas]
+
+        return CenariosPrevisao(valores,
+                                pd.period_range(next_month, periods=num_meses, freq='M'),
+                                self.df_base.columns,
+                                list(self.anos_))
+
+    def cenarios_extendidos(self,
+                            vazoes: Optional[VazoesTxt] = None,
+                            num_meses: Optional[int] = None,
+                            ) -> CenariosVazoes:
+        """
+        Previsão estendida de todos os anos escolhidos, sem copiar a base.
+
+        Alternativa a `previsao_extendida`: o histórico é compartilhado e
+        cada cenário guarda apenas os meses previstos.
+
+        Parameters
+        ----------
+        vazoes : VazoesTxt, optional
+            Objeto de vazões da base, para compartilhar seus dados.
+            Se não informado, é criado a partir de df_base.
+        num_meses : int, optional
+            Número de meses a serem previstos, como em `predict_lote`.
+
+        Returns
+        -------
+        CenariosVazoes
+            Um cenário para cada ano escolhido, na ordem de `anos_`.
+
+        """
+        if vazoes is None:
+            vazoes = VazoesTxt.from_df_period(self.df_base)
+
+        cenarios = self.predict_lote(num_meses)
+        # Postos na ordem das colunas da base de vazões
+        posicoes = cenarios.columns.get_indexer(vazoes.df_period.columns)
+        return CenariosVazoes(vazoes, cenarios.valores[:, :, posicoes])
+
     def previsao_extendida(self):
         """Utilizar esse método somente para exrever os arquivos em """
         #Retorna uma lista com nome das usinas
@@ -6,7 +6,8 @@
 import sys
 from pathlib import Path
 from vazoes_txt import VazoesTxt
-from modelo_camila_new import ModeloCamila
+from modelo_camila_new import fluxo_modelos
+from collections import deque
 
 
 
@@ -22,14 +23,11 @@ if (folder := str(folderpath)) not in sys.path:
 
 
 lista_arquivos = list()
-lista_modelos = list()
-anos_usados = list()
-#por enquanto uma lista
-resultados = list()
 
 
 #caminho = Path.home()
 caminho = r'C:/Workspace/cenarios_por_correlacao_de_vazoes/Arquivos_de_vazões_NEWAVE'
+caminho_saida = r'C:/Workspace/cenarios_por_correlacao_de_vazoes/Cenarios'
 
 
 def walk(caminho): 
@@ -43,36 +41,38 @@ def walk(caminho):
 # recursively traverse all files from current directory
 # the function returns a generator so if you need a list you need to build one
 
-all_files = list(walk(caminho))
-lista_vazoes = list()
-anos_usados = list()
-check_previsao_ext = list()
-
-for arq in all_files:    
-    # Criação do objeto de vazões
-    vazoes = VazoesTxt(arq)
-    lista_vazoes.append(vazoes)
-    #posteriormente modificar os parâmetros na classe Vazões
-    lista_arquivos.append(vazoes._filepath.stem)
-
-    
-for vaz in lista_vazoes:
-    # Criação do modelo.
+# O ajuste usa vários processos, que importam este script: a execução
+# precisa ficar protegida pelo if abaixo
+if __name__ == '__main__':
+    anos_usados = list()
+    # Arquivos já lidos e com o modelo ainda em ajuste, na ordem de entrada
+    vazoes_pendentes = deque()
+
+    def ler_vazoes():
+        # Os arquivos são lidos à medida que o ajuste tem vaga
+        for arq in walk(caminho):
+            vazoes = VazoesTxt(arq)
+            vazoes_pendentes.append(vazoes)
+            #posteriormente modificar os parâmetros na classe Vazões
+            lista_arquivos.append(vazoes._filepath.stem)
+            yield vazoes.df_period
+
+    # Criação dos modelos.
     # O modelo criado está bem simplificado, e estamos tentando seguir o exemplo
     # do scikit-learn, com métodos fit e predict.
-    model = ModeloCamila()
-    model.fit(vaz.df_period, anos_proibidos=anos_usados)
-    lista_modelos.append(model)
-    
-    
-    """verificar com o Yanase método extend"""
-    anos_usados.append(model.anos_)
-    
-    
-    """modifiacr aqui"""
-    # Predição para um novo período
-    model.predict()
-    resultados.append(model.previsao_extendida())
-    vazoes_new = vazoes.salvar_txt(resultados)
-    check_previsao_ext.append(vazoes_new)    
-        #anos_usados.extend(model.anos_)
+    # As correlações e testes da amplitude são calculados em paralelo; a
+    # escolha dos anos segue a ordem dos arquivos, sem repetir os anos usados
+    # nos anteriores (mesmo resultado do fit em sequência). Cada modelo é
+    # salvo e descartado antes do próximo: apenas os arquivos em andamento
+    # ficam em memória.
+    for model in fluxo_modelos(ler_vazoes()):
+        vazoes = vazoes_pendentes.popleft()
+        """verificar com o Yanase método extend"""
+        anos_usados.append(model.anos_)
+
+        # Previsão estendida de cada ano escolhido, um arquivo por ano
+        arq = vazoes._filepath
+        destinos = [Path(caminho_saida) / f'{arq.stem}_{ano}{arq.suffix}'
+                    for ano in model.anos_]
+        model.cenarios_extendidos(vazoes).salvar_todos(destinos)
+        del model, vazoes
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Telemetria da busca de candidatos no ranking das correlações.
+
+Cada ajuste registra, em um array, o motivo de cada candidato avaliado até
+o escolhido (ou até o fim da busca). Os registros de vários ajustes são
+somados em `TelemetriaBusca`, que mostra até onde a busca realmente vai e
+permite dimensionar o tamanho do ranking a partir dos dados.
+
+Exemplo:
+    telemetria = TelemetriaBusca()
+    for model in modelos:
+        telemetria.registrar(model.motivos_)
+    print(telemetria.tabela().to_string())
+"""
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from amplitude import APROVADO, FALHA_MAXIMO, FALHA_MINIMO
+
+# Candidato aprovado no teste da amplitude, mas com o ano já usado
+ANO_PROIBIDO = 3
+
+# Nome de cada motivo, na ordem dos códigos
+MOTIVOS = {
+    APROVADO: 'aprovado',
+    FALHA_MAXIMO: 'falha_maximo',
+    FALHA_MINIMO: 'falha_minimo',
+    ANO_PROIBIDO: 'ano_proibido',
+}
+
+
+class TelemetriaBusca:
+    """
+    Contagem dos motivos por posição do ranking, somada para várias buscas.
+
+    Attributes
+    ----------
+    num_buscas : int
+        Quantidade de buscas registradas.
+    contagem : ndarray
+        Candidatos avaliados (posição x motivo). A linha 0 corresponde à
+        posição 1 do ranking.
+    escolhidos : ndarray
+        Quantidade de buscas que terminaram em cada posição. A posição 0
+        conta as buscas em que nenhum candidato foi escolhido.
+
+    """
+
+    def __init__(self, num_posicoes: int = 20):
+        """
+        Criação do registro vazio.
+
+        Parameters
+        ----------
+        num_posicoes : int, optional
+            Posições reservadas inicialmente (os arrays crescem se
+            necessário). O default é 20.
+
+        """
+        self.num_buscas = 0
+        self.contagem = np.zeros((num_posicoes, len(MOTIVOS)), dtype=np.int64)
+        self.escolhidos = np.zeros(num_posicoes + 1, dtype=np.int64)
+
+    def _reservar(self, num_posicoes: int) -> None:
+        """Aumenta os arrays para comportar `num_posicoes` posições."""
+        if num_posicoes <= len(self.contagem):
+            return
+        contagem = np.zeros((num_posicoes, len(MOTIVOS)), dtype=np.int64)
+        contagem[:len(self.contagem)] = self.contagem
+        escolhidos = np.zeros(num_posicoes + 1, dtype=np.int64)
+        escolhidos[:len(self.escolhidos)] = self.escolhidos
+        self.contagem, self.escolhidos = contagem, escolhidos
+
+    def registrar(self, motivos: np.ndarray, posicao_inicial: int = 1) -> None:
+        """
+        Acrescenta uma busca.
+
+        Parameters
+        ----------
+        motivos : ndarray
+            Motivo de cada candidato avaliado, na ordem do ranking. A busca
+            termina no primeiro APROVADO, se houver.
+        posicao_inicial : int, optional
+            Posição no ranking do primeiro candidato. O default é 1.
+
+        """
+        motivos = np.asarray(motivos, dtype=np.intp)
+        posicao_final = posicao_inicial + len(motivos) - 1
+        self._reservar(posicao_final)
+
+        np.add.at(self.contagem,
+                  (np.arange(posicao_inicial - 1, posicao_final), motivos),
+                  1)
+        if len(motivos) > 0 and motivos[-1] == APROVADO:
+            self.escolhidos[posicao_final] += 1
+        else:
+            self.escolhidos[0] += 1
+        self.num_buscas += 1
+
+    def mesclar(self, outra: 'TelemetriaBusca') -> None:
+        """Soma as buscas de outro registro (por exemplo, de outro processo)."""
+        self._reservar(len(outra.contagem))
+        self.contagem[:len(outra.contagem)] += outra.contagem
+        self.escolhidos[:len(outra.escolhidos)] += outra.escolhidos
+        self.num_buscas += outra.num_buscas
+
+    def posicao_necessaria(self, fracao: float = 0.99) -> Optional[int]:
+        """
+        Menor posição do ranking que resolve a fração informada das buscas.
+
+        Parameters
+        ----------
+        fracao : float, optional
+            Fração das buscas que devem terminar em um candidato escolhido
+            até a posição retornada. O default é 0.99.
+
+        Returns
+        -------
+        int or None
+            Posição, ou None se a fração não for atingida pelas buscas
+            registradas (por exemplo, por buscas sem nenhum escolhido).
+
+        """
+        if self.num_buscas == 0:
+            return None
+        acumulado = np.cumsum(self.escolhidos[1:]) / self.num_buscas
+        posicoes = np.flatnonzero(acumulado >= fracao)
+        return int(posicoes[0]) + 1 if len(posicoes) > 0 else None
+
+    def tabela(self) -> pd.DataFrame:
+        """
+        Resumo por posição do ranking.
+
+        Returns
+        -------
+        DataFrame
+            Para cada posição: candidatos avaliados, quantidade de cada
+            motivo e buscas que terminaram na posição.
+
+        """
+        num_posicoes = int(np.max(np.flatnonzero(self.contagem.sum(axis=1)), initial=-1)) + 1
+        df = pd.DataFrame(self.contagem[:num_posicoes],
+                          index=pd.RangeIndex(1, num_posicoes + 1, name='posicao'),
+                          columns=list(MOTIVOS.values()))
+        df.insert(0, 'avaliados', df.sum(axis='columns'))
+        df['escolhidos'] = self.escolhidos[1:num_posicoes + 1]
+        return df
+
+    def salvar(self, arquivo_destino: Union[str, Path]) -> None:
+        """
+        Salva o resumo por posição em csv.
+
+        As buscas sem nenhum escolhido ficam na posição 0.
+
+        Parameters
+        ----------
+        arquivo_destino : str or Path
+            Nome ou caminho do arquivo de destino.
+
+        """
+        df = self.tabela()
+        sem_escolha = pd.DataFrame({'escolhidos': [self.escolhidos[0]]},
+                                   index=pd.Index([0], name='posicao'))
+        pd.concat([sem_escolha, df])[df.columns].fillna(0).astype(int).to_csv(arquivo_destino)
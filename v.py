@@ -1,12 +1,152 @@
 # -*- coding: utf-8 -*-
 """Arquivo vazoes.txt."""
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Union
+from typing import BinaryIO, Optional, Union
 
 import pandas as pd
 import numpy as np
 
+from amplitude import IndiceRazao
+from cache_correlacao import CACHE_CORRELACAO
+from modelos import CorrelacaoIncremental
+from perfil import bytes_df, etapa, medido
 
+
+# Layout de cada linha do arquivo: posto, espaço, ano e os doze meses
+LARGURA_POSTO = 3
+LARGURA_ANO = 4
+LARGURA_MES = 6
+LARGURA_LINHA = LARGURA_POSTO + 1 + LARGURA_ANO + 12 * LARGURA_MES
+
+_ESPACO, _MENOS, _ZERO = b' -0'
+
+# Início e fim de cada campo numérico da linha
+_INICIO_ANO = LARGURA_POSTO + 1
+_INICIO_MESES = _INICIO_ANO + LARGURA_ANO
+_INICIOS_CAMPOS = np.array([0, _INICIO_ANO,
+                            *range(_INICIO_MESES, LARGURA_LINHA, LARGURA_MES)])
+_FINS_CAMPOS = np.array([LARGURA_POSTO, _INICIO_MESES,
+                         *range(_INICIO_MESES + LARGURA_MES, LARGURA_LINHA + 1, LARGURA_MES)])
+_LARGURAS_CAMPOS = _FINS_CAMPOS - _INICIOS_CAMPOS
+
+# Formato de cada linha, o mesmo das f-strings originais de salvar_txt
+_FORMATO_LINHA = f"%{LARGURA_POSTO}d %{LARGURA_ANO}d" + f"%{LARGURA_MES}d" * 12
+
+# Quantidade de linhas formatadas por vez na escrita
+LINHAS_POR_BLOCO = 20000
+
+# Sufixo do diretório com o cache binário de um arquivo de vazões
+SUFIXO_CACHE = '.cache'
+
+
+def _converter_campos(digitos: np.ndarray, menos: np.ndarray) -> np.ndarray:
+    """
+    Converte campos de largura fixa em inteiros.
+
+    Parameters
+    ----------
+    digitos : ndarray
+        Valor de cada dígito (linhas x campos x largura), com 0 nos espaços.
+    menos : ndarray
+        Posições com sinal negativo (linhas x campos x largura).
+
+    Returns
+    -------
+    ndarray
+        Valores int32 (linhas x campos).
+
+    """
+    digitos = digitos.astype(np.int32)
+    valores = digitos[..., 0].copy()
+    for posicao in range(1, digitos.shape[-1]):
+        valores *= 10
+        valores += digitos[..., posicao]
+
+    if menos.any():
+        negativos = menos[..., 0].copy()
+        for posicao in range(1, menos.shape[-1]):
+            negativos |= menos[..., posicao]
+        np.negative(valores, out=valores, where=negativos)
+
+    return valores
+
+
+def _ler_largura_fixa(arquivo: Union[str, Path]) -> Optional[np.ndarray]:
+    """
+    Leitura direta dos bytes de um arquivo de vazões em largura fixa.
+
+    Parameters
+    ----------
+    arquivo : str or Path
+        Nome ou caminho do arquivo de vazões.txt.
+
+    Returns
+    -------
+    ndarray or None
+        Array int32 (linhas x 14) com posto, ano e os doze meses, ou None se
+        o arquivo não estiver exatamente no formato de largura fixa.
+
+    """
+    conteudo = np.fromfile(arquivo, dtype=np.uint8)
+    # A largura das linhas é definida pela primeira quebra de linha
+    quebras = np.flatnonzero(conteudo[:LARGURA_LINHA + 2] == ord('\n'))
+    if len(quebras) == 0:
+        return None
+
+    # Quebra de linha no estilo Windows (\r\n) ou Unix (\n)
+    largura = quebras[0] + 1
+    tamanho_quebra = 2 if largura > 1 and conteudo[largura - 2] == ord('\r') else 1
+    if largura - tamanho_quebra != LARGURA_LINHA:
+        return None
+
+    # Última linha sem quebra de linha
+    resto = len(conteudo) % largura
+    if resto:
+        if resto != LARGURA_LINHA:
+            return None
+        conteudo = np.append(conteudo, conteudo[LARGURA_LINHA:largura])
+
+    linhas = conteudo.reshape(-1, largura)
+    if (linhas[:, LARGURA_LINHA:] != linhas[0, LARGURA_LINHA:]).any():
+        return None
+    caracteres = linhas[:, :LARGURA_LINHA]
+
+    # Apenas dígitos, espaços e sinal negativo
+    espaco = caracteres == _ESPACO
+    menos = caracteres == _MENOS
+    digitos = caracteres - _ZERO
+    eh_digito = digitos < 10
+    if not (espaco | menos | eh_digito).all():
+        return None
+
+    # Números alinhados à direita: dentro de um campo, espaço ou sinal só
+    # podem vir depois de outro espaço, e o campo termina com um dígito
+    transicao_invalida = (espaco | menos)[:, 1:] & ~espaco[:, :-1]
+    transicao_invalida[:, LARGURA_POSTO - 1] = False
+    transicao_invalida[:, _INICIOS_CAMPOS[1:] - 1] = False
+    if (transicao_invalida.any()
+            or not espaco[:, LARGURA_POSTO].all()
+            or not eh_digito[:, _FINS_CAMPOS - 1].all()):
+        return None
+
+    # Espaços e sinais valem zero
+    digitos *= eh_digito
+
+    dados = np.empty((len(linhas), 14), dtype=np.int32)
+    for inicio, fim, largura_campo, destino in [
+            (0, LARGURA_POSTO, LARGURA_POSTO, dados[:, 0:1]),
+            (_INICIO_ANO, _INICIO_MESES, LARGURA_ANO, dados[:, 1:2]),
+            (_INICIO_MESES, LARGURA_LINHA, LARGURA_MES, dados[:, 2:])]:
+        formato = (len(linhas), -1, largura_campo)
+        destino[:] = _converter_campos(digitos[:, inicio:fim].reshape(formato),
+                                       menos[:, inicio:fim].reshape(formato))
+
+    return dados
+
+
+@medido('ler_arquivo', num_bytes=lambda arquivo: os.path.getsize(arquivo))
 def ler_arquivo_vazoes_txt(arquivo: Union[str, Path]) -> pd.DataFrame:
     """
     Leitura de um arquivo txt de vazões como dataframe.
@@ -14,10 +154,14 @@ def ler_arquivo_vazoes_txt(arquivo: Union[str, Path]) -> pd.DataFrame:
     O dataframe é semelhante ao formato original de linhas e colunas.
     Como índice ficam o posto e ano, e como colunas os meses.
 
+    Arquivos no formato de largura fixa (o mesmo gerado por `salvar_txt`) são
+    lidos diretamente como um array int32. Outros arquivos são lidos pelo
+    pandas, separando os campos por espaços.
+
     Parameters
     ----------
-    posto : int
-        Número do posto com o qual foi feita a correlação.
+    arquivo : str or Path
+        Nome ou caminho do arquivo de vazões.txt.
 
     Returns
     -------
@@ -25,6 +169,24 @@ def ler_arquivo_vazoes_txt(arquivo: Union[str, Path]) -> pd.DataFrame:
         Dataframe com os dados lidos.
 
     """
+    dados = _ler_largura_fixa(arquivo)
+    if dados is None:
+        return _ler_arquivo_vazoes_csv(arquivo)
+
+    return _df_arquivo_de_array(dados)
+
+
+def _df_arquivo_de_array(dados: np.ndarray) -> pd.DataFrame:
+    """Dataframe no formato do arquivo a partir do array (linhas x 14)."""
+    index = pd.MultiIndex.from_arrays([dados[:, 0], dados[:, 1]],
+                                      names=['posto', 'ano'])
+    columns = pd.Index(np.arange(1, 13), name='mes')
+
+    return pd.DataFrame(dados[:, 2:], index=index, columns=columns)
+
+
+def _ler_arquivo_vazoes_csv(arquivo: Union[str, Path]) -> pd.DataFrame:
+    """Leitura pelo pandas, para arquivos fora do formato de largura fixa."""
     # Leitura do arquivo como dataframe, usando espaços como separador.
     df_arq = pd.read_csv(arquivo, header=None, delim_whitespace=True)
     # Nomeação das colunas e índices
@@ -37,6 +199,20 @@ def ler_arquivo_vazoes_txt(arquivo: Union[str, Path]) -> pd.DataFrame:
     return df_arq
 
 
+def _periodos_de_ordinais(ordinais: np.ndarray) -> pd.PeriodIndex:
+    """PeriodIndex mensal (nome 'mes') a partir dos ordinais dos períodos."""
+    ordinais = np.asarray(ordinais, dtype=np.int64)
+    if len(ordinais) == 0:
+        return pd.PeriodIndex([], freq='M', name='mes')
+    inicio = int(ordinais.min())
+    periodos = pd.period_range(pd.Period(ordinal=inicio, freq='M'),
+                               periods=int(ordinais.max()) - inicio + 1,
+                               freq='M',
+                               name='mes')
+    return periodos[ordinais - inicio]
+
+
+@medido('periodizar', num_bytes=bytes_df)
 def _periodizar_df_arq(df_arq: pd.DataFrame) -> pd.DataFrame:
     """
     Cria um dataframe 'periodizado' (ano/mes x postos).
@@ -44,6 +220,10 @@ def _periodizar_df_arq(df_arq: pd.DataFrame) -> pd.DataFrame:
     Com o tempo como linhas e os postos como colunas, tem-se um dataframe
     mais simples com apenas duas dimensões, facilitando sua manipulação.
 
+    Como o arquivo é um cubo regular (posto x ano x mês), a conversão é
+    feita apenas reordenando os eixos do array. Arquivos irregulares usam a
+    conversão pelo pandas.
+
     Parameters
     ----------
     df_arq : DataFrame
@@ -55,6 +235,42 @@ def _periodizar_df_arq(df_arq: pd.DataFrame) -> pd.DataFrame:
         Dataframe com os dados 'periodizados'.
 
     """
+    postos = df_arq.index.get_level_values('posto').to_numpy()
+    anos = df_arq.index.get_level_values('ano').to_numpy()
+    postos_unicos = np.unique(postos)
+    anos_unicos = np.unique(anos)
+    num_postos, num_anos = len(postos_unicos), len(anos_unicos)
+
+    # Ordena por posto e ano e verifica se todas as combinações existem uma vez
+    ordem = np.lexsort((anos, postos))
+    regular = (len(df_arq) == num_postos * num_anos > 0
+               and sorted(df_arq.columns) == list(range(1, 13))
+               and (postos[ordem] == np.repeat(postos_unicos, num_anos)).all()
+               and (anos[ordem] == np.tile(anos_unicos, num_postos)).all())
+    if not regular:
+        return _periodizar_df_arq_pandas(df_arq)
+
+    valores = df_arq[list(range(1, 13))].to_numpy()
+    if valores.dtype.kind not in 'iu':
+        return _periodizar_df_arq_pandas(df_arq)
+
+    # (posto x ano x mes) -> (ano x mes x posto) -> (ano/mes x posto)
+    cubo = valores[ordem].reshape(num_postos, num_anos, 12)
+    valores_period = cubo.transpose(1, 2, 0).reshape(num_anos * 12, num_postos)
+    ordinais = (((anos_unicos.astype(np.int64) - 1970) * 12)[:, np.newaxis]
+                + np.arange(12)).ravel()
+
+    # Meses em que todos os postos são 0 são excluídos
+    # Presume-se aqui que isso só acontece nos períodos finais
+    preenchidos = (valores_period != 0).any(axis=1)
+
+    return pd.DataFrame(valores_period[preenchidos],
+                        index=_periodos_de_ordinais(ordinais[preenchidos]),
+                        columns=pd.Index(postos_unicos, name='posto'))
+
+
+def _periodizar_df_arq_pandas(df_arq: pd.DataFrame) -> pd.DataFrame:
+    """Versão de _periodizar_df_arq pelo pandas, para arquivos irregulares."""
     # Empilha os meses e desempilha o posto
     df_period = df_arq.stack().unstack('posto')
 
@@ -78,14 +294,23 @@ def _periodizar_df_arq(df_arq: pd.DataFrame) -> pd.DataFrame:
     return df_period
 
 
-def _desperiodizar_df_arq(df_period: pd.DataFrame) -> pd.DataFrame:
+@medido('desperiodizar', num_bytes=bytes_df)
+def _desperiodizar_df_arq(df_period: pd.DataFrame,
+                          ano_final: Optional[int] = None,
+                          ) -> pd.DataFrame:
     """
     Cria um dataframe 'desperiodizado', voltando ao formato tradicional.
 
+    A conversão é feita posicionando os meses em um cubo (ano x mês x posto)
+    e reordenando os eixos. Dados com NaN usam a conversão pelo pandas.
+
     Parameters
     ----------
     df_period : DataFrame
         Dataframe com os dados 'periodizados'.
+    ano_final : int, optional
+        Último ano a ser incluído, com meses zerados após o último período.
+        O default é o ano do último período.
 
     Returns
     -------
@@ -93,6 +318,99 @@ def _desperiodizar_df_arq(df_period: pd.DataFrame) -> pd.DataFrame:
         Dataframe com os dados 'desperiodizados'.
 
     """
+    valores = df_period.to_numpy()
+    if valores.dtype.kind not in 'iu':
+        if np.isnan(valores).any():
+            return _desperiodizar_df_arq_pandas(df_period, ano_final)
+        valores = valores.astype(int)
+
+    ordinais = df_period.index.asi8
+    anos_unicos = np.unique(ordinais // 12 + 1970)
+    # Anos zerados até o final do último ano do arquivo
+    if ano_final is not None and ano_final > anos_unicos[-1]:
+        anos_unicos = np.concatenate([anos_unicos,
+                                      np.arange(anos_unicos[-1] + 1, ano_final + 1)])
+
+    # Ordena os postos, como no sort_index
+    ordem_postos = np.argsort(df_period.columns.to_numpy(), kind='stable')
+    cubo = _cubo_arquivo(valores[:, ordem_postos], ordinais, anos_unicos)
+
+    # (ano x mes x posto) -> (posto x ano x mes) -> (posto/ano x mes)
+    valores_arq = cubo.transpose(2, 0, 1).reshape(-1, 12)
+    index = pd.MultiIndex.from_product([df_period.columns[ordem_postos], anos_unicos],
+                                       names=[df_period.columns.name, 'ano'])
+
+    return pd.DataFrame(valores_arq,
+                        index=index,
+                        columns=pd.Index(np.arange(1, 13), name='mes'))
+
+
+def _cubo_arquivo(valores: np.ndarray,
+                  ordinais: np.ndarray,
+                  anos: np.ndarray,
+                  ) -> np.ndarray:
+    """
+    Posiciona os meses em um cubo (ano x mês x posto), no layout do arquivo.
+
+    Parameters
+    ----------
+    valores : ndarray
+        Vazões (meses x postos).
+    ordinais : ndarray
+        Ordinais dos períodos de cada linha de `valores`.
+    anos : ndarray
+        Anos do cubo, em ordem crescente, incluindo os de todos os períodos.
+
+    Returns
+    -------
+    ndarray
+        Cubo (ano x mês x posto). Os meses ausentes ficam com 0.
+
+    """
+    cubo = np.zeros((len(anos), 12, valores.shape[1]), dtype=valores.dtype)
+    cubo[np.searchsorted(anos, ordinais // 12 + 1970), ordinais % 12] = valores
+    return cubo
+
+
+def _linhas_arquivo(cubo: np.ndarray,
+                    postos: np.ndarray,
+                    anos: np.ndarray,
+                    ) -> np.ndarray:
+    """
+    Linhas do arquivo (posto, ano e os doze meses) a partir do cubo.
+
+    Parameters
+    ----------
+    cubo : ndarray
+        Cubo (ano x mês x posto), como em `_cubo_arquivo`.
+    postos : ndarray
+        Postos de cada coluna do cubo.
+    anos : ndarray
+        Anos de cada linha do cubo.
+
+    Returns
+    -------
+    ndarray
+        Inteiros (linhas x 14), ordenados por posto e ano.
+
+    """
+    num_anos = len(anos)
+    return np.column_stack([np.repeat(postos, num_anos),
+                            np.tile(anos, len(postos)),
+                            cubo.transpose(2, 0, 1).reshape(-1, 12)])
+
+
+def _desperiodizar_df_arq_pandas(df_period: pd.DataFrame,
+                                 ano_final: Optional[int] = None,
+                                 ) -> pd.DataFrame:
+    """Versão de _desperiodizar_df_arq pelo pandas, para dados com NaN."""
+    # Meses zerados até o final do último ano do arquivo
+    if ano_final is not None and ano_final > df_period.index[-1].year:
+        df_period = df_period.reindex(pd.period_range(df_period.index[0],
+                                                      pd.Period(year=ano_final, month=12, freq='M'),
+                                                      freq='M'),
+                                      fill_value=0)
+
     df_arq = df_period.set_index([df_period.index.year,
                                 df_period.index.month])
     df_arq.index.names = ['ano', 'mes']
@@ -107,10 +425,145 @@ def _desperiodizar_df_arq(df_period: pd.DataFrame) -> pd.DataFrame:
     return df_arq
 
 
+def _formatar_linhas(dados: np.ndarray,
+                     quebra: bytes = os.linesep.encode(),
+                     ) -> np.ndarray:
+    """
+    Formata as linhas do arquivo de vazões de uma só vez.
+
+    Parameters
+    ----------
+    dados : ndarray
+        Inteiros (linhas x 14) com posto, ano e os doze meses.
+    quebra : bytes, optional
+        Quebra de linha. O default é a do sistema, como na escrita em modo texto.
+
+    Returns
+    -------
+    ndarray
+        Array uint8 (linhas x largura da linha) com o texto de cada linha.
+
+    """
+    dados = np.asarray(dados, dtype=np.int64)
+    absolutos = np.abs(dados)
+    negativos = dados < 0
+
+    # Quantidade de dígitos de cada campo (o zero tem um dígito)
+    num_digitos = np.ones(dados.shape, dtype=np.int64)
+    for expoente in range(1, LARGURA_MES + 1):
+        num_digitos += absolutos >= 10 ** expoente
+    if (num_digitos + negativos > _LARGURAS_CAMPOS).any():
+        # Algum número não cabe no campo: usa a formatação do Python,
+        # que apenas alarga o campo
+        texto = ''.join(_FORMATO_LINHA % tuple(linha) + quebra.decode()
+                        for linha in dados.tolist())
+        return np.frombuffer(texto.encode(), dtype=np.uint8).reshape(1, -1)
+
+    buffer = np.full((len(dados), LARGURA_LINHA + len(quebra)), ord(' '), dtype=np.uint8)
+    buffer[:, LARGURA_LINHA:] = np.frombuffer(quebra, dtype=np.uint8)
+
+    # Dígitos da direita para a esquerda, até a largura de cada campo
+    for posicao in range(LARGURA_MES):
+        campos = np.flatnonzero(_LARGURAS_CAMPOS > posicao)
+        digito = (absolutos[:, campos] // 10 ** posicao) % 10 + ord('0')
+        buffer[:, _FINS_CAMPOS[campos] - 1 - posicao] = np.where(
+            posicao < num_digitos[:, campos], digito, ord(' '))
+
+    # Sinal logo antes do primeiro dígito
+    linhas, campos = np.nonzero(negativos)
+    buffer[linhas, _FINS_CAMPOS[campos] - 1 - num_digitos[linhas, campos]] = ord('-')
+
+    return buffer
+
+
+def _escrever_linhas(file: BinaryIO, dados: np.ndarray) -> None:
+    """
+    Escreve as linhas no arquivo, formatando em blocos.
+
+    Parameters
+    ----------
+    file : file object
+        Arquivo aberto para escrita binária.
+    dados : ndarray
+        Inteiros (linhas x 14) com posto, ano e os doze meses.
+
+    """
+    for inicio in range(0, len(dados), LINHAS_POR_BLOCO):
+        file.write(_formatar_linhas(dados[inicio:inicio + LINHAS_POR_BLOCO]).tobytes())
+
+
+def _caminho_cache(arquivo: Path) -> Path:
+    """Diretório do cache binário, ao lado do arquivo de vazões."""
+    return arquivo.with_name(arquivo.name + SUFIXO_CACHE)
+
+
+def _assinatura_arquivo(arquivo: Path) -> np.ndarray:
+    """Data de modificação (ns) e tamanho do arquivo, para invalidar o cache."""
+    stat = arquivo.stat()
+    return np.array([stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+
+def _salvar_npy(destino: Path, **arrays: np.ndarray) -> None:
+    """Salva cada array em um .npy, trocando o arquivo de uma só vez."""
+    for nome, array in arrays.items():
+        temporario = destino / f"{nome}.{os.getpid()}.tmp"
+        with open(temporario, 'wb') as file:
+            np.save(file, array, allow_pickle=False)
+        os.replace(temporario, destino / f"{nome}.npy")
+
+
+def df_somente_leitura(df: pd.DataFrame,
+                       index: Optional[pd.Index] = None,
+                       ) -> pd.DataFrame:
+    """
+    Dataframe somente leitura que compartilha os dados do original.
+
+    Usado pelos modelos no lugar de `df_base.copy()` no fit: a base nunca é
+    alterada pelos modelos, então a cópia é desnecessária, e vários modelos
+    ajustados sobre o mesmo arquivo compartilham um único buffer. Qualquer
+    tentativa de alterar os valores gera um erro.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Dados com um único tipo (por exemplo, 'periodizados').
+    index : Index, optional
+        Novo index, com o mesmo tamanho. O default é manter o do original.
+
+    Returns
+    -------
+    DataFrame
+        Vista somente leitura dos dados.
+
+    """
+    valores = df.to_numpy().view()
+    valores.flags.writeable = False
+    return pd.DataFrame(valores,
+                        index=df.index if index is None else index,
+                        columns=df.columns,
+                        copy=False)
+
+
+def _valores_int32(df: pd.DataFrame) -> np.ndarray:
+    """Valores do dataframe como array int32 contíguo, com NaN gravado como zero."""
+    valores = df.to_numpy()
+    if valores.dtype.kind == 'f':
+        # NaN convertido diretamente para int32 viraria -2147483648
+        valores = np.where(np.isnan(valores), 0, valores)
+    return np.ascontiguousarray(valores, dtype=np.int32)
+
+
 class VazoesTxt:
     """
     Classe que representa o arquivo vazoes.txt.
 
+    Os dados ficam em um único array int32 contíguo (meses x postos). Os
+    dataframes são construídos sob demanda: df_period é uma vista sem cópia
+    desse array, e df_arquivo é criado apenas quando usado.
+
+    Com `sob_demanda=True` o arquivo só é lido no primeiro acesso aos dados,
+    e `liberar` descarta os dados lidos, que são lidos novamente se usados.
+
     Attributes
     ----------
     df_arquivo : DataFrame
@@ -121,7 +574,10 @@ class VazoesTxt:
 
     """
 
-    def __init__(self, arquivo: Optional[Union[str, Path]] = None):
+    def __init__(self,
+                 arquivo: Optional[Union[str, Path]] = None,
+                 usar_cache: bool = False,
+                 sob_demanda: bool = False):
         """
         Construtor do objeto.
 
@@ -129,15 +585,246 @@ class VazoesTxt:
         ----------
         arquivo : str or Path, optional
             Nome ou caminho do arquivo de vazões.txt utilizado.
+        usar_cache : bool, optional
+            Se True, os dados são lidos do cache binário ao lado do arquivo
+            (mapeado em memória) quando ele estiver atualizado, e o cache é
+            criado ou refeito caso contrário. O default é False.
+        sob_demanda : bool, optional
+            Se True, apenas o caminho e o tamanho do arquivo são obtidos
+            aqui, e a leitura fica para o primeiro acesso aos dados. O
+            default é False.
 
         """
         self._filepath = Path(arquivo) if arquivo else None
+        self._usar_cache = usar_cache
+        # Data de modificação e tamanho do arquivo na última consulta
+        self._assinatura = _assinatura_arquivo(self._filepath) if arquivo else None
+        # Se os dados foram alterados após a leitura (não podem ser liberados)
+        self._alterado = False
+        # Estado das correlações e índice das razões, criados apenas se usados
+        self._correlacao = None
+        self._indice_razao = None
 
-        # Construção dos dataframes.
-        # Poderiam ser tanto métodos como funções à parte,
-        # discutir o que seria melhor
-        self.df_arquivo = ler_arquivo_vazoes_txt(self._filepath) if arquivo else None
-        self.df_period = _periodizar_df_arq(self.df_arquivo) if arquivo else None
+        # Dados (meses x postos), com os períodos e postos correspondentes
+        self._valores = None
+        self._periodos = None
+        self._postos = None
+        # Último ano do arquivo, que pode ter apenas meses zerados
+        self._ano_final = None
+        # Dataframes construídos sob demanda
+        self._df_period = None
+        self._df_arquivo = None
+
+        if arquivo and not sob_demanda:
+            self._carregar()
+
+    def _carregar(self) -> None:
+        """Lê o arquivo (ou o cache binário, se usado e atualizado)."""
+        self._assinatura = _assinatura_arquivo(self._filepath)
+
+        if not (self._usar_cache and self.carregar_cache()):
+            # Construção dos dataframes.
+            # Poderiam ser tanto métodos como funções à parte,
+            # discutir o que seria melhor
+            self.df_arquivo = ler_arquivo_vazoes_txt(self._filepath)
+            self._alterado = False
+
+            if self._usar_cache:
+                self.salvar_cache()
+
+    def _garantir_dados(self) -> None:
+        """Lê o arquivo, caso ainda não tenha sido lido ou tenha sido liberado."""
+        if self._valores is None and self._filepath is not None:
+            self._carregar()
+
+    @property
+    def carregado(self) -> bool:
+        """Se os dados estão em memória."""
+        return self._valores is not None
+
+    @property
+    def tamanho_arquivo(self) -> Optional[int]:
+        """Tamanho do arquivo (bytes), sem lê-lo."""
+        return int(self._assinatura[1]) if self._assinatura is not None else None
+
+    def liberar(self) -> None:
+        """
+        Descarta os dados lidos e os estados calculados a partir deles.
+
+        O arquivo é lido novamente no próximo acesso aos dados. Dataframes
+        obtidos antes continuam válidos, mas deixam de ser compartilhados com
+        o objeto.
+
+        Raises
+        ------
+        ValueError
+            Se os dados não vieram de um arquivo ou foram alterados depois da
+            leitura (por exemplo, por `add_novo_periodo(inplace=True)`).
+
+        """
+        if self._filepath is None or self._alterado:
+            raise ValueError("Apenas os dados lidos do arquivo, sem alterações, podem ser liberados")
+
+        self._valores = None
+        self._periodos = None
+        self._postos = None
+        self._ano_final = None
+        self._df_period = None
+        self._df_arquivo = None
+        self._correlacao = None
+        self._indice_razao = None
+
+    @property
+    def df_period(self) -> Optional[pd.DataFrame]:
+        """
+        Representação (ano/mes x posto), sem cópia dos dados.
+
+        O dataframe é somente leitura, com os dados lidos do arquivo ou do
+        cache: alterar os valores no local deixaria df_arquivo e os estados
+        das correlações e do índice das razões desatualizados. Para alterar
+        os dados, atribuir um novo dataframe a df_period.
+
+        """
+        self._garantir_dados()
+        if self._df_period is None and self._valores is not None:
+            self._df_period = df_somente_leitura(pd.DataFrame(self._valores,
+                                                              index=self._periodos,
+                                                              columns=self._postos,
+                                                              copy=False))
+        return self._df_period
+
+    @df_period.setter
+    def df_period(self, df_period: pd.DataFrame) -> None:
+        self._definir_valores(df_period)
+
+    @property
+    def df_arquivo(self) -> Optional[pd.DataFrame]:
+        """Representação no estilo do arquivo, criada no primeiro acesso."""
+        self._garantir_dados()
+        if self._df_arquivo is None and self._valores is not None:
+            self._df_arquivo = _desperiodizar_df_arq(self.df_period, self._ano_final)
+        return self._df_arquivo
+
+    @df_arquivo.setter
+    def df_arquivo(self, df_arquivo: pd.DataFrame) -> None:
+        self._definir_valores(_periodizar_df_arq(df_arquivo),
+                              ano_final=df_arquivo.index.get_level_values('ano').max())
+
+    def _definir_valores(self,
+                         df_period: pd.DataFrame,
+                         ano_final: Optional[int] = None,
+                         ) -> None:
+        """
+        Substitui os dados do objeto a partir de um dataframe 'periodizado'.
+
+        Parameters
+        ----------
+        df_period : DataFrame
+            Dados 'periodizados' (ano/mes x posto). Valores ausentes (NaN)
+            são gravados como zero, como no `fillna(0)` da desperiodização.
+        ano_final : int, optional
+            Último ano do arquivo. O default é o ano do último período.
+
+        """
+        self._valores = _valores_int32(df_period)
+        self._periodos = df_period.index
+        self._postos = df_period.columns
+        self._ano_final = int(ano_final) if ano_final is not None else None
+        self._df_period = None
+        self._df_arquivo = None
+        self._alterado = True
+        # Estados calculados a partir dos dados anteriores
+        self._correlacao = None
+        self._indice_razao = None
+
+    def salvar_cache(self) -> Path:
+        """
+        Salva os dados no cache binário ao lado do arquivo.
+
+        O cache é um diretório com arrays .npy, que podem ser mapeados em
+        memória e compartilhados por vários processos. A assinatura gravada é
+        a do arquivo no momento da leitura, e não a atual: se o arquivo mudar
+        depois da leitura, o cache já nasce desatualizado.
+
+        Returns
+        -------
+        Path
+            Diretório do cache.
+
+        Raises
+        ------
+        ValueError
+            Se não houver arquivo de origem ou se os dados foram alterados
+            depois da leitura.
+
+        """
+        if self._filepath is None:
+            raise ValueError("O cache exige o arquivo de origem")
+        self._garantir_dados()
+        if self._alterado:
+            raise ValueError("O cache só pode conter os dados lidos do arquivo, sem alterações")
+
+        destino = _caminho_cache(self._filepath)
+        destino.mkdir(exist_ok=True)
+
+        # A assinatura é removida antes e gravada por último, de forma que um
+        # cache incompleto nunca seja considerado válido
+        (destino / 'assinatura.npy').unlink(missing_ok=True)
+
+        ano_final = self._ano_final if self._ano_final is not None else -1
+        _salvar_npy(destino,
+                    valores=self._valores,
+                    periodos=self._periodos.asi8,
+                    postos=self._postos.to_numpy(dtype=np.int64),
+                    ano_final=np.array(ano_final, dtype=np.int64))
+        _salvar_npy(destino, assinatura=self._assinatura)
+
+        return destino
+
+    def carregar_cache(self, mmap: bool = True) -> bool:
+        """
+        Carrega os dados do cache binário, se estiver atualizado.
+
+        O cache é considerado desatualizado se a data de modificação ou o
+        tamanho do arquivo de origem mudaram.
+
+        Parameters
+        ----------
+        mmap : bool, optional
+            Se True (default), os dados são mapeados em memória (somente
+            leitura), sem cópia.
+
+        Returns
+        -------
+        bool
+            True se o cache foi carregado.
+
+        """
+        origem = _caminho_cache(self._filepath)
+        try:
+            assinatura = np.load(origem / 'assinatura.npy')
+            if not np.array_equal(assinatura, _assinatura_arquivo(self._filepath)):
+                return False
+
+            valores = np.load(origem / 'valores.npy', mmap_mode='r' if mmap else None)
+            periodos = np.load(origem / 'periodos.npy')
+            postos = np.load(origem / 'postos.npy')
+            ano_final = int(np.load(origem / 'ano_final.npy'))
+        except (FileNotFoundError, ValueError):
+            return False
+
+        self._valores = valores
+        self._periodos = _periodos_de_ordinais(periodos)
+        self._postos = pd.Index(postos, name='posto')
+        self._ano_final = ano_final if ano_final >= 0 else None
+        self._df_period = None
+        self._df_arquivo = None
+        # Dados iguais aos do arquivo, sem os estados dos dados anteriores
+        self._alterado = False
+        self._correlacao = None
+        self._indice_razao = None
+
+        return True
 
 
     @classmethod
@@ -153,10 +840,10 @@ class VazoesTxt:
         """
         self = cls()
         self.df_period = df_period
-        self.df_arquivo = _desperiodizar_df_arq(self.df_period)
 
         return self
 
+    @medido('add_novo_periodo')
     def add_novo_periodo(self,
                          df_new_months: pd.DataFrame,
                          inplace: bool = False,
@@ -191,18 +878,79 @@ class VazoesTxt:
         df_new = pd.concat([self.df_period, df_new_months_ajust],
                             verify_integrity=True)
 
+        # Atualiza as correlações e o índice das razões apenas com os novos
+        # meses, antes de alterar o objeto: se a atualização falhar, o objeto
+        # fica como estava
+        colunas = self.df_period.columns
+        correlacao, indice_razao = None, None
+        estados = self._correlacao is not None or self._indice_razao is not None
+        if estados and df_new.columns.equals(colunas):
+            # Os postos ausentes nos novos meses ficam zerados, como em
+            # df_period. Com postos novos os estados são descartados e
+            # refeitos quando usados
+            novos = pd.DataFrame(_valores_int32(df_new_months_ajust.reindex(columns=colunas)),
+                                 index=df_new_months_ajust.index,
+                                 columns=colunas)
+            if self._correlacao is not None:
+                correlacao = self._correlacao.copy().adicionar(novos)
+            if self._indice_razao is not None:
+                indice_razao = self._indice_razao.copy().adicionar(novos)
+
         # Se não muda localmente, retorna um novo objeto
         if inplace is False:
-            return self.from_df_period(df_new)
+            novo = self.from_df_period(df_new)
+            novo._correlacao, novo._indice_razao = correlacao, indice_razao
+            return novo
 
-        # Muda o objeto no local
+        # Muda o objeto no local. A versão desnormalizada (df_arquivo) é
+        # refeita apenas quando for usada
         self.df_period = df_new
-        # Desnormaliza
-        self.df_arquivo = _desperiodizar_df_arq(self.df_period)
+        self._correlacao, self._indice_razao = correlacao, indice_razao
 
         return None
 
 
+    def calc_corr_last12(self) -> pd.DataFrame:
+        """
+        Correlação dos últimos 12 meses com os mesmos 12 meses de outros anos.
+
+        Na primeira chamada é criado um estado incremental, que acompanha o
+        objeto em `add_novo_periodo`: depois de acrescentar meses a tabela é
+        atualizada sem recalcular todo o histórico. A tabela também é
+        registrada no cache de correlações usado pelos modelos no fit.
+
+        Returns
+        -------
+        DataFrame
+            Mesmo resultado de `modelos.calc_corr_last12(self.df_period)`.
+
+        """
+        if self._correlacao is None:
+            self._correlacao = CorrelacaoIncremental(self.df_period)
+
+        df_corr = self._correlacao.tabela()
+        CACHE_CORRELACAO.guardar(self.df_period, df_corr)
+
+        return df_corr
+
+    def indice_razao(self) -> IndiceRazao:
+        """
+        Razões mínima e máxima do histórico por mês e posto.
+
+        O índice é criado na primeira chamada e acompanha o objeto em
+        `add_novo_periodo`, sendo atualizado apenas com os novos meses. Pode
+        ser passado ao `TesteAmplitude` para não recalcular os limites.
+
+        Returns
+        -------
+        IndiceRazao
+            Limites do Teste da Amplitude, nas colunas de df_period.
+
+        """
+        if self._indice_razao is None:
+            self._indice_razao = IndiceRazao.from_df_period(self.df_period)
+        return self._indice_razao
+
     def salvar_txt(self,
                    arquivo_destino: Union[str, Path],
                    ) -> None:
@@ -215,16 +963,270 @@ class VazoesTxt:
             Nome ou caminho do arquivo de destino.
 
         """
-        lista_linhas = list()
-        for idx, row in self.df_arquivo.iterrows():
-            lista_linhas.append(f"{idx[0]:3} {idx[1]:4}"
-                                f"{row[1]:6}{row[2]:6}{row[3]:6}"
-                                f"{row[4]:6}{row[5]:6}{row[6]:6}"
-                                f"{row[7]:6}{row[8]:6}{row[9]:6}"
-                                f"{row[10]:6}{row[11]:6}{row[12]:6}")
+        index = self.df_arquivo.index
+        dados = np.column_stack([index.get_level_values(0),
+                                 index.get_level_values(1),
+                                 self.df_arquivo[list(range(1, 13))].to_numpy()])
+
+        # Em modo binário, com a quebra de linha do sistema (como no modo texto)
+        with open(arquivo_destino, 'wb') as file, etapa('salvar_txt') as medida:
+            _escrever_linhas(file, dados)
+            medida.num_bytes = file.tell()
+
+
+class CenariosVazoes:
+    """
+    Cenários que estendem o histórico de um mesmo arquivo de vazões.
+
+    O histórico é compartilhado por todos os cenários (sem cópia), e cada
+    cenário guarda apenas os meses acrescentados após o final do histórico.
+    Equivale a um `add_novo_periodo` por cenário, com memória da ordem de
+    histórico + cenários x meses, em vez de cenários x histórico.
+
+    Attributes
+    ----------
+    base : VazoesTxt
+        Histórico compartilhado.
+    extensoes : ndarray
+        Meses acrescentados (cenários x meses x postos), nas colunas da base.
+    index : PeriodIndex
+        Meses acrescentados, a partir do mês seguinte ao final do histórico.
+
+    """
+
+    def __init__(self, base: VazoesTxt, extensoes: np.ndarray):
+        """
+        Criação dos cenários.
+
+        Parameters
+        ----------
+        base : VazoesTxt
+            Histórico compartilhado. Não deve ser liberado (`liberar`)
+            enquanto os cenários forem usados.
+        extensoes : ndarray
+            Meses acrescentados (cenários x meses x postos), com os postos na
+            mesma ordem das colunas de `base.df_period`.
+
+        """
+        base._garantir_dados()
+        extensoes = np.asarray(extensoes)
+        if extensoes.ndim != 3 or extensoes.shape[2] != len(base._postos):
+            raise ValueError("As extensões devem ter o formato (cenários x meses x postos)")
+
+        self.base = base
+        self.extensoes = extensoes.astype(np.int32, copy=False)
+        self.index = pd.period_range(base._periodos[-1] + 1,
+                                     periods=extensoes.shape[1],
+                                     freq='M',
+                                     name=base._periodos.name)
+        # Divisão dos anos e texto do histórico, calculados no primeiro uso
+        self._divisao = None
+        self._historico = None
+
+    @classmethod
+    def from_dfs(cls, base: VazoesTxt, lista_df_new_months: list) -> 'CenariosVazoes':
+        """
+        Construtor a partir de um dataframe de novos meses por cenário.
+
+        Parameters
+        ----------
+        base : VazoesTxt
+            Histórico compartilhado.
+        lista_df_new_months : list of DataFrame
+            Novos meses de cada cenário, todos com a mesma quantidade de meses.
+            Como em `add_novo_periodo`, o index é ajustado para continuar o
+            histórico.
+
+        """
+        extensoes = np.stack([df[base.df_period.columns].to_numpy() for df in lista_df_new_months])
+        return cls(base, extensoes)
+
+    def __len__(self) -> int:
+        return len(self.extensoes)
+
+    def df_period(self, i: int) -> pd.DataFrame:
+        """
+        Dataframe 'periodizado' completo de um cenário.
+
+        Concatena o histórico com a extensão, criando uma cópia completa:
+        usar apenas quando necessário.
+
+        Parameters
+        ----------
+        i : int
+            Posição do cenário.
+
+        Returns
+        -------
+        DataFrame
+            Mesmo resultado de `add_novo_periodo(...).df_period`.
+
+        """
+        return pd.DataFrame(np.concatenate([self.base._valores, self.extensoes[i]]),
+                            index=self.base._periodos.append(self.index),
+                            columns=self.base._postos)
+
+    def vazoes(self, i: int) -> VazoesTxt:
+        """Objeto VazoesTxt completo de um cenário (com cópia do histórico)."""
+        return VazoesTxt.from_df_period(self.df_period(i))
+
+    def _divisao_arquivo(self) -> tuple:
+        """
+        Divisão dos anos do arquivo entre o histórico e a parte final.
+
+        Os anos anteriores ao primeiro mês acrescentado são iguais em todos os
+        cenários e vêm diretamente do histórico. Apenas os anos finais de cada
+        posto dependem da extensão.
+
+        Returns
+        -------
+        tuple
+            Quantidade de meses do histórico usados nos anos anteriores, anos
+            do histórico, ordinais e anos da parte final, e a ordem dos postos.
+
+        """
+        if self._divisao is None:
+            ordinais = self.base._periodos.asi8
+            # Primeiro período do ano em que começa a extensão
+            limite = (self.index[0].year - 1970) * 12 if len(self.index) else ordinais[-1] + 1
+            num_historico = np.searchsorted(ordinais, limite)
+            ordinais_final = np.concatenate([ordinais[num_historico:], self.index.asi8])
+
+            self._divisao = (num_historico,
+                             np.unique(ordinais[:num_historico] // 12 + 1970),
+                             ordinais_final,
+                             np.unique(ordinais_final // 12 + 1970),
+                             # Postos em ordem crescente, como no arquivo
+                             np.argsort(self.base._postos.to_numpy(), kind='stable'))
+        return self._divisao
+
+    def _formatar_por_posto(self,
+                            cubo: np.ndarray,
+                            anos: np.ndarray,
+                            ) -> Optional[np.ndarray]:
+        """
+        Texto das linhas do cubo, como array uint8 (posto x ano x largura).
+
+        Retorna None se algum número não couber no campo, pois as linhas
+        deixam de ter a mesma largura.
+
+        """
+        num_postos = cubo.shape[2]
+        postos = self.base._postos.to_numpy()[self._divisao_arquivo()[4]]
+        buffer = _formatar_linhas(_linhas_arquivo(cubo, postos, anos))
+        # Com números fora do campo o texto vem em uma única linha, que com
+        # um posto e um ano teria a mesma quantidade de linhas: a largura
+        # também é verificada
+        largura = LARGURA_LINHA + len(os.linesep.encode())
+        if buffer.shape != (num_postos * len(anos), largura):
+            return None
+        return buffer.reshape(num_postos, len(anos), largura)
+
+    def _historico_formatado(self) -> Optional[np.ndarray]:
+        """Texto dos anos do histórico, formatado uma única vez para todos os cenários."""
+        if self._historico is None:
+            num_historico, anos_historico, _, _, ordem_postos = self._divisao_arquivo()
+            cubo = _cubo_arquivo(self.base._valores[:num_historico, ordem_postos],
+                                 self.base._periodos.asi8[:num_historico],
+                                 anos_historico)
+            self._historico = self._formatar_por_posto(cubo, anos_historico)
+            # Marca o histórico que não pode ser formatado com largura fixa
+            if self._historico is None:
+                self._historico = False
+        return self._historico if self._historico is not False else None
+
+    def _cubo_final(self, i: int) -> np.ndarray:
+        """Cubo (ano x mês x posto) dos anos finais de um cenário."""
+        num_historico, _, ordinais_final, anos_final, ordem_postos = self._divisao_arquivo()
+        valores_final = np.concatenate([self.base._valores[num_historico:],
+                                        self.extensoes[i]])
+        return _cubo_arquivo(valores_final[:, ordem_postos], ordinais_final, anos_final)
+
+    @medido('salvar_cenario')
+    def salvar_txt(self, i: int, arquivo_destino: Union[str, Path]) -> None:
+        """
+        Salva um cenário em um arquivo de vazões.txt.
+
+        O texto dos anos do histórico é formatado uma única vez e reaproveitado
+        por todos os cenários; para cada cenário apenas os anos finais de cada
+        posto são formatados. O histórico completo do cenário nunca é criado.
+
+        Parameters
+        ----------
+        i : int
+            Posição do cenário.
+        arquivo_destino : str or Path
+            Nome ou caminho do arquivo de destino.
+
+        """
+        _, anos_historico, _, anos_final, ordem_postos = self._divisao_arquivo()
+        cubo_final = self._cubo_final(i)
+
+        historico = self._historico_formatado()
+        final = self._formatar_por_posto(cubo_final, anos_final) if historico is not None else None
+        if final is None:
+            self._salvar_txt_sem_formato_fixo(arquivo_destino, cubo_final)
+            return
+
+        num_anos = len(anos_historico) + len(anos_final)
+        postos_por_bloco = max(LINHAS_POR_BLOCO // max(num_anos, 1), 1)
+
+        # Em modo binário, com a quebra de linha do sistema (como no modo texto)
+        with open(arquivo_destino, 'wb') as file:
+            for inicio in range(0, len(ordem_postos), postos_por_bloco):
+                bloco = slice(inicio, inicio + postos_por_bloco)
+                # Para cada posto, os anos do histórico seguidos dos anos finais
+                file.write(np.concatenate([historico[bloco], final[bloco]], axis=1).tobytes())
+
+    def _salvar_txt_sem_formato_fixo(self,
+                                     arquivo_destino: Union[str, Path],
+                                     cubo_final: np.ndarray,
+                                     ) -> None:
+        """Escrita em blocos de postos, para números que não cabem no campo."""
+        num_historico, anos_historico, _, anos_final, ordem_postos = self._divisao_arquivo()
+        postos = self.base._postos.to_numpy()[ordem_postos]
+        anos = np.concatenate([anos_historico, anos_final])
+        postos_por_bloco = max(LINHAS_POR_BLOCO // max(len(anos), 1), 1)
+
+        with open(arquivo_destino, 'wb') as file:
+            for inicio in range(0, len(postos), postos_por_bloco):
+                bloco = slice(inicio, inicio + postos_por_bloco)
+                cubo = np.concatenate([
+                    _cubo_arquivo(self.base._valores[:num_historico, ordem_postos[bloco]],
+                                  self.base._periodos.asi8[:num_historico],
+                                  anos_historico),
+                    cubo_final[:, :, bloco]])
+                file.write(_formatar_linhas(_linhas_arquivo(cubo, postos[bloco], anos)).tobytes())
+
+    def salvar_todos(self,
+                     arquivos_destino: list,
+                     threads: Optional[int] = None,
+                     ) -> None:
+        """
+        Salva todos os cenários, um arquivo de vazões.txt por cenário.
+
+        O histórico é formatado uma única vez, antes de qualquer escrita.
+
+        Parameters
+        ----------
+        arquivos_destino : list of str or Path
+            Arquivo de destino de cada cenário, na ordem dos cenários.
+        threads : int, optional
+            Se informado, os arquivos são escritos por um pool com essa
+            quantidade de threads, sobrepondo formatação e escrita em disco.
+            O default é escrever em sequência.
+
+        """
+        if len(arquivos_destino) != len(self):
+            raise ValueError("Deve ser informado um arquivo de destino por cenário")
+
+        self._historico_formatado()
 
-        conteudo_arquivo = '\n'.join(lista_linhas)
+        if threads is None:
+            for i, arquivo_destino in enumerate(arquivos_destino):
+                self.salvar_txt(i, arquivo_destino)
+            return
 
-        with open(arquivo_destino, 'w') as file:
-            file.write(conteudo_arquivo)
-            file.write('\n')
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            # list() propaga as exceções das threads
+            list(executor.map(self.salvar_txt, range(len(self)), arquivos_destino))